@@ -19,7 +19,9 @@ setup(
     entry_points={
         'console_scripts': [
             'aprs2gpaero = x2gpaero.aprs2gp:main',
-            'ogn2gpaero = x2gpaero.ogn2gp:main'
+            'ogn2gpaero = x2gpaero.ogn2gp:main',
+            'x2gpaero-soak = x2gpaero.soak:main',
+            'x2gpaero-supervisor = x2gpaero.supervisor:main'
         ]
     },
     classifiers=[
@@ -0,0 +1,80 @@
+"""
+checks for x2gpaero.decimate, on synthetic 1Hz tracks.
+"""
+
+import math
+from x2gpaero.decimate import TrackDecimator, distance_m, heading_difference_deg
+
+
+def aprs_round(value):
+	'''
+	round to the 0.01 minute plain aprs resolution
+	'''
+	return round(value * 6000.0) / 6000.0
+
+
+def straight(n, heading_deg = 40.0, speed = 30.0, lat0 = 35.0, lng0 = -118.0):
+	'''
+	1Hz fixes on a straight line, at aprs resolution; (lat, lng, altitude, time)
+	'''
+	out = []
+	for t in range(n):
+		north = speed * t * math.cos(math.radians(heading_deg))
+		east = speed * t * math.sin(math.radians(heading_deg))
+		out.append((aprs_round(lat0 + north / 111195.0), aprs_round(lng0 + east / (111195.0 * math.cos(math.radians(lat0)))), 1000.0, float(t)))
+	return out
+
+
+def circle(n, radius = 1000.0, rate_deg = 1.72, lat0 = 35.0, lng0 = -118.0):
+	'''
+	1Hz fixes on a steady turn, with the course; (lat, lng, altitude, time, course)
+	'''
+	out = []
+	for t in range(n):
+		angle = math.radians(rate_deg * t)
+		lat = lat0 + radius * math.cos(angle) / 111195.0
+		lng = lng0 + radius * math.sin(angle) / (111195.0 * math.cos(math.radians(lat0)))
+		out.append((lat, lng, 1000.0, float(t), (math.degrees(angle) + 90.0) % 360.0))
+	return out
+
+
+def test_straight_line_without_course():
+	d = TrackDecimator()
+	reasons = [d.update(*fix) for fix in straight(300)]
+	kept = [r for r in reasons if r is not None]
+	# quantisation noise is no turn; only the keepalive (or distance) keeps fixes.
+	assert 'heading' not in kept
+	assert kept[0] == 'first'
+	assert len(kept) <= 12
+
+
+def test_steady_turn():
+	d = TrackDecimator()
+	track = circle(600)
+	kept = [fix for fix in track if d.update(*fix) is not None]
+	# ~20 deg of turn at 1.72 deg / sec is one fix every ~12 sec, about what min_packet_dt = 10 keeps.
+	assert 40 <= len(kept) <= 60
+	for a, b in zip(kept, kept[1:]):
+		assert b[3] - a[3] >= 10.0
+		assert heading_difference_deg(a[4], b[4]) < 25.0
+	# the uploaded track stays close to the circle - a 12 sec chord is ~15 m inside it.
+	for a, b in zip(kept, kept[1:]):
+		mid = ((a[0] + b[0]) / 2, (a[1] + b[1]) / 2)
+		assert 1000.0 - distance_m(35.0, -118.0, mid[0], mid[1]) < 25.0
+
+
+def test_steady_turn_without_course():
+	d = TrackDecimator()
+	kept = [fix for fix in circle(600) if d.update(*fix[:4]) is not None]
+	assert 30 <= len(kept) <= 60
+
+
+def test_out_of_order():
+	d = TrackDecimator()
+	track = straight(10, heading_deg = 0.0)
+	for fix in track[:4]:
+		d.update(*fix)
+	# a late fix from way off the line, then the track carries on
+	assert d.update(track[1][0], track[1][1] + 0.01, 1000.0, 1.5) is None
+	assert d.update(track[3][0], track[3][1], 1000.0, track[3][3]) is None
+	assert all(d.update(*fix) is None for fix in track[4:])
@@ -0,0 +1,58 @@
+"""
+checks for x2gpaero.fusion; arrival times are passed in, so nothing depends on the clock.
+"""
+
+from x2gpaero.fusion import PilotFusion
+
+
+def fix(srccall, t, precision = None):
+	return {'srccall' : srccall, 'time' : t, 'precision' : precision}
+
+
+def test_same_moment_from_several_receivers():
+	f = PilotFusion(window_sec = 2.0, prefer = 'precision')
+	assert f.add('P', fix('A', 100.0, 5.0), 0.0)
+	assert f.add('P', fix('B', 100.0, 2.0), 0.3)
+	assert f.add('P', fix('C', 100.2, 9.0), 0.5)
+	assert f.flush(1.9) == []
+	out = f.flush(2.0)
+	assert len(out) == 1
+	best, dropped = out[0]
+	assert best['srccall'] == 'B'
+	assert sorted(x['srccall'] for x in dropped) == ['A', 'C']
+
+
+def test_consecutive_fixes_from_one_tracker_all_pass():
+	f = PilotFusion(window_sec = 2.0)
+	passed = []
+	for t in range(20):
+		assert f.add('P', fix('A', 100.0 + t), float(t))
+		passed.extend(f.flush(float(t)))
+	passed.extend(f.flush(float('inf')))
+	assert [best['time'] for best, _ in passed] == [100.0 + t for t in range(20)]
+	assert all(len(dropped) == 0 for _, dropped in passed)
+
+
+def test_stale_fixes_dropped():
+	f = PilotFusion(window_sec = 2.0)
+	f.add('P', fix('A', 100.0), 0.0)
+	f.flush(2.0)
+	# the same moment again, e.g. from a slow receiver, and an older fix
+	assert not f.add('P', fix('B', 100.0), 3.0)
+	assert not f.add('P', fix('B', 99.0), 3.0)
+	assert f.add('P', fix('B', 101.0), 3.0)
+	# other pilots are independent
+	assert f.add('Q', fix('C', 50.0), 3.0)
+
+
+def test_flush_inf_passes_everything_in_time_order():
+	f = PilotFusion(window_sec = 2.0)
+	f.add('P', fix('A', 101.0), 0.0)
+	f.add('P', fix('B', 100.0), 0.1)
+	f.add('Q', fix('C', 100.0), 0.1)
+	assert f.flush(1.0) == []
+	out = f.flush(float('inf'))
+	assert sorted((best['srccall'], best['time']) for best, _ in out) == [('A', 101.0), ('B', 100.0), ('C', 100.0)]
+	assert [best['time'] for best, _ in out if best['srccall'] in ('A', 'B')] == [100.0, 101.0]
+	assert f.pending == {}
+	assert f.flush(float('inf')) == []
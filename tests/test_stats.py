@@ -0,0 +1,88 @@
+"""
+checks for x2gpaero.stats, driven through the now arguments so they don't depend on the clock.
+run with python -m pytest tests
+"""
+
+import math
+from x2gpaero.stats import SlidingWindowRate, EWMARate, PacketStats
+
+
+def feed(counter, rate, start, end):
+	'''
+	add one event at a time, at a steady rate, over [start, end); returns the time of the last one.
+	'''
+	t = start
+	last = start
+	while t < end:
+		counter.add(1, t)
+		last = t
+		t += 1.0 / rate
+	return last
+
+
+def test_window_steady_rate():
+	w = SlidingWindowRate(60.0, now = 0.0)
+	last = feed(w, 66.7, 0.0, 200.0)
+	assert abs(w.rate(last) - 66.7) / 66.7 < 0.005
+	# part way through a bucket as well
+	last = feed(w, 66.7, 200.0, 200.5)
+	assert abs(w.rate(last) - 66.7) / 66.7 < 0.005
+
+
+def test_window_before_full():
+	w = SlidingWindowRate(60.0, now = 0.0)
+	last = feed(w, 10.0, 0.0, 5.0)
+	assert abs(w.rate(last) - 10.0) < 0.5
+
+
+def test_window_idle_decay():
+	w = SlidingWindowRate(60.0, now = 0.0)
+	last = feed(w, 10.0, 0.0, 120.0)
+	assert abs(w.rate(last + 30.0) - 5.0) < 0.5
+	assert w.rate(last + 61.0) == 0.0
+	# long idle, then half a window of traffic again
+	last = feed(w, 10.0, 10000.0, 10030.0)
+	assert abs(w.rate(last) - 5.0) < 0.5
+
+
+def test_window_zero_span():
+	w = SlidingWindowRate(60.0, now = 0.0)
+	assert w.rate(0.0) == 0.0
+	w.add(5, 0.0)
+	assert w.rate(0.0) == 5.0
+
+
+def test_ewma_steady_and_decay():
+	e = EWMARate(10.0, now = 0.0)
+	last = feed(e, 20.0, 0.0, 200.0)
+	assert abs(e.rate(last) - 20.0) < 0.5
+	assert abs(e.rate(last + 10.0) - e.rate(last) * math.exp(-1)) < 1e-9
+	assert e.rate(last + 1000.0) < 1e-9
+
+
+def test_packet_stats_right_after_reset():
+	p = PacketStats(['A'], window_sec = 60.0)
+	now = p.started_at
+	p.count('received', n = 5, now = now)
+	snapshot = p.snapshot(now)
+	assert snapshot['totals']['received'] == 5
+	assert all(math.isfinite(v) for rates in snapshot['rates'].values() for v in rates.values())
+
+
+def test_packet_stats_breakdowns():
+	p = PacketStats(['A', 'B'])
+	p.count('good', 'A', 'RX1')
+	p.count('good', 'A', 'RX2')
+	p.count('duplicate', 'B', 'RX1')
+	p.count('rate_limit', 'UNTRACKED', 'RX1')
+	p.count('parse_failed')
+	snapshot = p.snapshot()
+	assert snapshot['per_id']['A']['good'] == 2
+	assert snapshot['per_id']['B']['duplicate'] == 1
+	assert 'UNTRACKED' not in snapshot['per_id']
+	assert snapshot['per_receiver']['RX1'] == {'good' : 1, 'rate_limit' : 1, 'duplicate' : 1, 'decimated' : 0, 'fused' : 0, 'upload_failed' : 0}
+	assert snapshot['totals']['good'] == 2
+	assert snapshot['totals']['parse_failed'] == 1
+	# snapshots are copies
+	snapshot['per_id']['A']['good'] = 100
+	assert p.per_id['A']['good'] == 2
@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+"""
+compare min_packet_dt rate limiting against track aware decimation on recorded flights.
+input is a raw packet log, as recorded in aprs2gpaero_all_packet.log (i.e. with _LOG_ALL set).
+for each id, reports how many fixes each method would upload, and the track error - distance between
+every recorded fix and the track glideport would draw (linear interpolation in time between uploaded fixes).
+
+e.g.
+	python3 benchmark_decimation.py /tmp/aprs2gpaero_all_packet.log --ogn --min_packet_dt 1 5 10
+"""
+
+import argparse
+import json
+import time
+from collections import defaultdict
+from x2gpaero.decimate import TrackDecimator, distance_m
+
+
+def read_tracks(filename, ogn = False, ignore_course = False):
+	'''
+	Returns:
+		dictionary of id : list of (lat, lng, altitude, time, course or None) sorted by time
+	'''
+	if ogn:
+		from ogn.parser import parse
+	else:
+		from aprslib import parse
+	tracks = defaultdict(list)
+	with open(filename, 'r', errors = 'ignore') as f:
+		for line in f:
+			line = line.strip()
+			if len(line) == 0:
+				continue
+			try:
+				d = parse(line)
+			except Exception:
+				continue
+			if d is None or 'latitude' not in d:
+				continue
+			src = d.get('from', d.get('address'))
+			timestamp = d.get('timestamp', None)
+			if timestamp is None:
+				continue
+			if not isinstance(timestamp, (int, float)):
+				timestamp = timestamp.timestamp()
+			# as in fix_course: ogn reports track, aprs course with 0 meaning unknown.
+			course = d.get('track', None) if ogn else (d.get('course', None) or None)
+			if ignore_course or course is None:
+				course = None
+			else:
+				course = course % 360
+			tracks[src].append((d['latitude'], d['longitude'], d.get('altitude', 0), timestamp, course))
+	for k in tracks:
+		tracks[k].sort(key = lambda x : x[3])
+	return tracks
+
+
+def rate_limit(track, min_packet_dt):
+	'''
+	same selection as the filter_callsigns min_packet_dt path
+	'''
+	kept = []
+	last = 0.0
+	for fix in track:
+		if fix[3] - last >= min_packet_dt:
+			kept.append(fix)
+			last = fix[3]
+	return kept
+
+
+def decimate(track, **kwargs):
+	d = TrackDecimator(**kwargs)
+	return [fix for fix in track if d.update(*fix) is not None]
+
+
+def track_error(track, kept):
+	'''
+	distance of each recorded fix from the uploaded track, meters.
+	Returns:
+		(mean, 95th percentile, max)
+	'''
+	errors = []
+	j = 0
+	for lat, lng, alt, t, _ in track:
+		while j + 1 < len(kept) and kept[j + 1][3] <= t:
+			j += 1
+		a = kept[j]
+		if j + 1 < len(kept) and kept[j + 1][3] > a[3] and t >= a[3]:
+			b = kept[j + 1]
+			f = (t - a[3]) / (b[3] - a[3])
+			p_lat = a[0] + f * (b[0] - a[0])
+			p_lng = a[1] + f * (b[1] - a[1])
+		else:
+			# past the last uploaded fix, glideport shows the last one.
+			p_lat, p_lng = a[0], a[1]
+		errors.append(distance_m(lat, lng, p_lat, p_lng))
+	errors.sort()
+	return sum(errors) / len(errors), errors[int(0.95 * (len(errors) - 1))], errors[-1]
+
+
+def report(name, track, kept, dt):
+	mean, p95, worst = track_error(track, kept)
+	print('{:<32} {:>7d} {:>7.1f}% {:>9.1f} {:>9.1f} {:>9.1f}   {:0.2f} sec'.format(name, len(kept), 100.0 * len(kept) / len(track), mean, p95, worst, dt))
+
+
+def main():
+	parser = argparse.ArgumentParser(description = 'benchmark fix decimation against min_packet_dt rate limiting')
+	parser.add_argument('packet_log', type = str)
+	parser.add_argument('--ogn', action = 'store_true', help = 'parse as ogn packets')
+	parser.add_argument('--min_packet_dt', type = float, nargs = '+', default = [1.0, 5.0, 10.0])
+	parser.add_argument('--decimation', type = str, default = '{}', help = 'json dictionary of TrackDecimator arguments')
+	parser.add_argument('--ignore_course', action = 'store_true', help = 'drop the reported course, so decimation works out headings from positions')
+	parser.add_argument('--min_fixes', type = int, default = 60, help = 'ignore ids with fewer fixes than this')
+	args = parser.parse_args()
+	decimation = json.loads(args.decimation)
+
+	tracks = read_tracks(args.packet_log, ogn = args.ogn, ignore_course = args.ignore_course)
+	print('{:<32} {:>7} {:>8} {:>9} {:>9} {:>9}'.format('method', 'uploads', 'of all', 'mean m', 'p95 m', 'max m'))
+	for src, track in tracks.items():
+		if len(track) < args.min_fixes:
+			continue
+		print('\n{:} : {:0d} fixes over {:0.0f} sec'.format(src, len(track), track[-1][3] - track[0][3]))
+		for min_packet_dt in args.min_packet_dt:
+			t0 = time.perf_counter()
+			kept = rate_limit(track, min_packet_dt)
+			report('min_packet_dt = {:0.1f}'.format(min_packet_dt), track, kept, time.perf_counter() - t0)
+		t0 = time.perf_counter()
+		kept = decimate(track, **decimation)
+		report('decimation {:}'.format(args.decimation), track, kept, time.perf_counter() - t0)
+
+
+if __name__ == '__main__':
+	main()
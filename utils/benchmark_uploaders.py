@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+"""
+per fix cost of the upload paths, against the local fake glideport from x2gpaero.soak.
+reports client cpu (of the uploading thread only, so the fake server doesn't count), wall time, and bytes on the wire at the
+http / stream level in each direction (tcp/ip overhead not included; it's per packet, and the stream path sends fewer).
+
+fixes are handed over the way send_locations does: fixes_per_cycle at a time, i.e. what ~1Hz pilots produce per cycle.
+
+e.g.
+	python3 benchmark_uploaders.py --fixes 2000 --fixes_per_cycle 5
+"""
+
+import time
+import argparse
+from x2gpaero.soak import FakeGlideportServer
+from x2gpaero.uploaders import IRPushUploader, StreamUploader
+
+
+def make_events(n):
+	return [{'imei' : 'BENCH{:0d}'.format(i % 10),
+		'timeStamp' : 1554359951000 + 1000 * i,
+		'point' : {'latitude' : -32.067333 + 1e-5 * i, 'longitude' : 115.827333 + 1e-5 * i, 'altitude' : 23.1648 + 0.1 * i}} for i in range(n)]
+
+
+def run(name, uploader, server, events, fixes_per_cycle):
+	stats_before = dict(server.stats)
+	t_cpu = time.thread_time()
+	t_wall = time.perf_counter()
+	failed = 0
+	for i in range(0, len(events), fixes_per_cycle):
+		failed += len(uploader.upload(events[i : i + fixes_per_cycle]))
+	t_cpu = time.thread_time() - t_cpu
+	t_wall = time.perf_counter() - t_wall
+	# streamed fixes aren't acknowledged; wait until the server has seen them all.
+	deadline = time.time() + 10
+	while server.stats['accepted'] - stats_before['accepted'] < len(events) - failed and time.time() < deadline:
+		time.sleep(0.01)
+	uploader.close()
+	n = len(events)
+	print('{:<28} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>7d}'.format(name,
+		1e6 * t_cpu / n, 1e6 * t_wall / n,
+		(server.stats['bytes_in'] - stats_before['bytes_in']) / n,
+		(server.stats['bytes_out'] - stats_before['bytes_out']) / n, failed))
+
+
+def main():
+	parser = argparse.ArgumentParser(description = 'benchmark the ir_push and stream upload paths')
+	parser.add_argument('--fixes', type = int, default = 2000)
+	parser.add_argument('--fixes_per_cycle', type = int, default = 5)
+	args = parser.parse_args()
+
+	server = FakeGlideportServer(stream = True).start()
+	events = make_events(args.fixes)
+	print('{:<28} {:>10} {:>10} {:>10} {:>10} {:>7}'.format('uploader', 'cpu us/fix', 'wall us/fix', 'B/fix up', 'B/fix down', 'failed'))
+	run('ir_push', IRPushUploader(url = server.url), server, events, args.fixes_per_cycle)
+	run('ir_push, per cycle post', IRPushUploader(url = server.url, max_events_per_post = args.fixes_per_cycle), server, events, args.fixes_per_cycle)
+	run('stream', StreamUploader(server.addr, server.stream_port), server, events, args.fixes_per_cycle)
+	server.stop()
+
+
+if __name__ == '__main__':
+	main()
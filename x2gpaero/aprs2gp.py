@@ -18,6 +18,7 @@ from __future__ import print_function
 
 import os
 import time
+import signal
 import logging
 import subprocess
 import socket
@@ -29,12 +30,17 @@ from collections import deque
 from functools import wraps
 import argparse
 import aprslib
+from x2gpaero.decimate import TrackDecimator
+from x2gpaero.fusion import PilotFusion
+from x2gpaero.uploaders import make_uploader, UPLOADERS
+from x2gpaero.sinks import make_sink
+from x2gpaero.stats import PacketStats
 
 _DEBUG = False
 _LOG_ALL = False
 _UPLOAD = True # set to False for debugging, so it doesn't actually interact with glideport.aero, but one can see what would have been uploaded etc
 
-_USABLE_KEYWORDS = ['verbose', 'wait_between_checks', 'max_wait_between_checks', 'max_consecutive_data_loss', 'socket_timeout', 'print_info_every_x_seconds', 'print_stats_every_x_seconds', 'print_monitor_every_x_seconds', 'calculate_mean_window_sec', 'min_packet_dt', 'N_last_packets', 'socket_timeout', 'delay']
+_USABLE_KEYWORDS = ['verbose', 'wait_between_checks', 'max_wait_between_checks', 'max_consecutive_data_loss', 'socket_timeout', 'print_info_every_x_seconds', 'print_stats_every_x_seconds', 'print_monitor_every_x_seconds', 'calculate_mean_window_sec', 'min_packet_dt', 'N_last_packets', 'socket_timeout', 'delay', 'decimation', 'upload_url', 'upload_timeout', 'fusion', 'uploaders', 'default_uploader', 'pilot_uploaders', 'server_filter', 'max_silence_sec', 'sinks']
 
 
 def config_file_reader(filename):
@@ -47,6 +53,17 @@ def config_file_reader(filename):
 	return config
 
 
+def stop_on_signals():
+	'''
+	treat SIGTERM (e.g. a service manager) and SIGHUP (e.g. the ssh connection of a remote supervisor worker going away) like ctrl-c,
+	so monitor() still cleans up on the way out.
+	'''
+	def stop(signum, frame):
+		raise KeyboardInterrupt
+	for signum in (signal.SIGTERM, signal.SIGHUP):
+		signal.signal(signum, stop)
+
+
 def create_attr_from_args(func):
 	'''
 	decorator that create instance attributes from a method's arguments.
@@ -92,16 +109,31 @@ class APRSBase(object):
 		N_last_packets: length of buffer kept for packet deduplication [5]
 		wait_between_checks: nominal time to wait after getting and processing one set of packets [1.0]
 		min_packet_dt: [10.0]
+		decimation: dictionary of TrackDecimator arguments; if given, fixes are selected by track geometry instead of min_packet_dt [None]
+		upload_url: where packets are pushed to by the default ir_push uploader ['http://glideport.aero/spot/ir_push.php']
+		upload_timeout: seconds to wait for the upload server before giving up on a packet [10.0]
+		uploaders: dictionary of name : make_uploader arguments, in addition to 'ir_push' (which can be overridden) [None]
+		default_uploader: name of the uploader used unless pilot_uploaders says otherwise ['ir_push']
+		pilot_uploaders: dictionary of id or IMEI : uploader name [None]
+		sinks: dictionary of name : make_sink arguments, i.e. where fixes go; defaults to just glideport [None]
+		fusion: dictionary of PilotFusion arguments; if given, ids sharing an IMEI are fused into one stream per pilot before rate limiting / decimation [None]
 	'''
 
+	# window for the rate statistics (see stats.py); configurable for the raw socket classes.
+	calculate_mean_window_sec = 60
+	# upload protocols the uploaders config can name, see uploaders.py; the soak harness widens it.
+	upload_protocols = UPLOADERS
+
 	@create_attr_from_args
-	def __init__(self, ids_to_be_tracked, verbose = False, print_stats_every_x_seconds = 600, print_monitor_every_x_seconds = 2**64 -1, max_wait_between_checks = 1800.0, N_last_packets = 5, wait_between_checks = 1.0, min_packet_dt = 10.0, **kwargs):
+	def __init__(self, ids_to_be_tracked, verbose = False, print_stats_every_x_seconds = 600, print_monitor_every_x_seconds = 2**64 -1, max_wait_between_checks = 1800.0, N_last_packets = 5, wait_between_checks = 1.0, min_packet_dt = 10.0, decimation = None, upload_url = 'http://glideport.aero/spot/ir_push.php', upload_timeout = 10.0, fusion = None, uploaders = None, default_uploader = 'ir_push', pilot_uploaders = None, sinks = None, **kwargs):
 		"""
 		ids : a dictionary of callsign : IMEI items.
 		"""
 		self.N_id_groups = len(self.ids_to_be_tracked.keys()) / 20 + 1
 		self.default_wait_between_checks = self.wait_between_checks
 		self.setup_loggers()
+		self.setup_uploaders()
+		self.setup_sinks()
 		try:
 			self.logger.info('git branch %s', subprocess.check_output(['git', 'branch', '-v']).decode('utf-8').split('\n')[0] )
 			git_diff = subprocess.check_output(['git',  'diff']).decode('utf-8')
@@ -115,6 +147,19 @@ class APRSBase(object):
 		self.logger.info('kwargs = %s', kwargs)
 		for aprs_id, IMEI in self.ids_to_be_tracked.items():
 			self.logger.info('Tracking %s : %s', aprs_id, IMEI)
+		self.check_shared_imeis()
+
+	def check_shared_imeis(self):
+		'''
+		ids sharing an IMEI are only merged into one stream with fusion; otherwise their fixes are uploaded interleaved.
+		note other gateway processes (e.g. ogn2gpaero next to aprs2gpaero) can't be seen from here, and are never fused with this one.
+		'''
+		ids_by_imei = {}
+		for k, IMEI in self.ids_to_be_tracked.items():
+			ids_by_imei.setdefault(IMEI, []).append(k)
+		for IMEI, ids in ids_by_imei.items():
+			if len(ids) > 1 and self.fusion is None:
+				self.logger.warning('ids %s share IMEI %s but fusion is off, so their fixes will be uploaded interleaved', ids, IMEI)
 
 	def setup_loggers(self):
 		'''
@@ -129,7 +174,8 @@ class APRSBase(object):
 
 		rlogger.setLevel(logging.DEBUG if self.verbose else logging.INFO)
 
-		self.log_filename = os.path.join(tempfile.gettempdir(), time.strftime('{:}_%Y_%m_%d_%H_%M_%S.log'.format(self.__class__.__name__)))
+		# the pid keeps e.g. supervisor workers started in the same second out of each other's logs.
+		self.log_filename = os.path.join(tempfile.gettempdir(), time.strftime('{:}_%Y_%m_%d_%H_%M_%S_{:0d}.log'.format(self.__class__.__name__, os.getpid())))
 		fh = logging.FileHandler(self.log_filename)
 		sh = logging.StreamHandler()
 		for handle in (fh, sh):
@@ -139,6 +185,44 @@ class APRSBase(object):
 		self.logger = logging.getLogger('X2GP')
 		self.logger.info('Logging to %s', self.log_filename)
 
+	def setup_uploaders(self):
+		'''
+		build the uploaders by name; ir_push is always there, matching the original behaviour.
+		'''
+		configs = {'ir_push' : {'protocol' : 'ir_push', 'url' : self.upload_url, 'timeout' : self.upload_timeout}}
+		configs.update(self.uploaders if self.uploaders is not None else {})
+		self.uploader_by_name = {name : make_uploader(protocols = self.upload_protocols, **config) for name, config in configs.items()}
+		if self.default_uploader not in self.uploader_by_name:
+			raise ValueError('default uploader {:} not in {:}'.format(self.default_uploader, list(self.uploader_by_name.keys())))
+		for k, name in (self.pilot_uploaders if self.pilot_uploaders is not None else {}).items():
+			if name not in self.uploader_by_name:
+				raise ValueError('uploader {:} for {:} not in {:}'.format(name, k, list(self.uploader_by_name.keys())))
+		for name, config in configs.items():
+			self.logger.info('uploader %s : %s', name, config)
+
+	def setup_sinks(self):
+		'''
+		build the sinks by name; each gets every fix, see sinks.py.
+		'''
+		configs = self.sinks if self.sinks is not None else {'glideport' : {'sink_type' : 'glideport'}}
+		self.sink_by_name = {}
+		for name, config in configs.items():
+			config = dict(config)
+			if config.get('sink_type', 'glideport') == 'glideport':
+				config.update(uploader_by_name = self.uploader_by_name, uploader_for = self.uploader_for, on_upload_failed = self.upload_failed, upload = _UPLOAD)
+			self.sink_by_name[name] = make_sink(name, **config)
+			self.logger.info('sink %s : %s', name, configs[name])
+
+	def uploader_for(self, srccall):
+		'''
+		name of the uploader for an id - by id first, then by its IMEI, then the default.
+		'''
+		if self.pilot_uploaders is not None:
+			for k in (srccall, self.ids_to_be_tracked[srccall]):
+				if k in self.pilot_uploaders:
+					return self.pilot_uploaders[k]
+		return self.default_uploader
+
 	def reset(self):
 		# monitor will reassert thes, but just in case
 		self.start_time = 0
@@ -148,9 +232,70 @@ class APRSBase(object):
 		self.locations = []
 		self.wait_between_checks = self.default_wait_between_checks
 		self.recent_packets = {k : deque([], maxlen = self.N_last_packets) for k in self.ids_to_be_tracked}
+		# with fusion, fixes from all the ids of a pilot (IMEI) are merged first, and selected per pilot from there on.
+		self.pilot_fusion = None if self.fusion is None else PilotFusion(**self.fusion)
+		selection_keys = set(self.selection_key(k) for k in self.ids_to_be_tracked)
 		# accept new packet only after min_packet_dt seconds since last valid one.
-		self.last_packet_time = {k : 0.0 for k in self.ids_to_be_tracked}
-		self.packet_stats = {k : {'good' : 0, 'rate_limit' : 0, 'duplicate' : 0} for k in self.ids_to_be_tracked}
+		self.last_packet_time = {k : 0.0 for k in selection_keys}
+		# or, if configured, let a per id decimator pick fixes based on the track geometry.
+		self.decimators = None if self.decimation is None else {k : TrackDecimator(**self.decimation) for k in selection_keys}
+		self.stats = PacketStats(self.ids_to_be_tracked, window_sec = self.calculate_mean_window_sec)
+		# per id counters, as logged and aggregated by the supervisor.
+		self.packet_stats = self.stats.per_id
+
+	def selection_key(self, srccall):
+		'''
+		rate limiting / decimation state is kept per id, or per pilot (IMEI) when fusing.
+		'''
+		return srccall if self.fusion is None else self.ids_to_be_tracked[srccall]
+
+	def select_fix(self, fix, packet):
+		'''
+		decide whether a new (non duplicate) fix gets uploaded, and if so add it to the locations.
+		Args:
+			fix: dictionary with srccall, lat, lng, altitude, time (seconds, not yet dst shifted), and optionally receiver and course
+			packet: raw packet, for logging
+		'''
+		srccall = fix['srccall']
+		receiver = fix.get('receiver', None)
+		key = self.selection_key(srccall)
+		timestamp = fix['time']
+		if self.decimators is not None and self.decimators[key].update(fix['lat'], fix['lng'], fix['altitude'], timestamp, fix.get('course', None)) is None:
+			self.logger.debug('Decimating packet : %s', packet)
+			self.stats.count('decimated', srccall, receiver)
+		elif self.decimators is None and timestamp - self.last_packet_time.get(key, 0) < self.min_packet_dt:
+			self.logger.warning('Got new packet too soon - %0.1f sec after last one, < %0.1f sec : %s', timestamp - self.last_packet_time.get(key, 0), self.min_packet_dt, packet)
+			self.stats.count('rate_limit', srccall, receiver)
+		else:
+			self.stats.count('good', srccall, receiver)
+			self.last_packet_time[key] = timestamp
+			# i seem to have an issue with OGN and daylight saving time.
+			# however, the place to fix it is post filtering / selection, so it's here - the default fix method is a passthrough.
+			# shift timestamp \after\ i save the recent packet time - so i only change what's uploaded, not the local time stamping.
+			timestamp = self.shift_time_based_on_local_dst(timestamp, fix['lat'], fix['lng'])
+			self.logger.info('Adding packet : %s', packet)
+			self.locations.append({'srccall' : srccall,
+						'lng' : fix['lng'],
+						'lat' : fix['lat'],
+						'altitude' : fix['altitude'],
+						'time' : timestamp,
+						'receiver' : receiver})
+			if _DEBUG or self.verbose:
+				self.logger.debug('after adding\n%s', self.locations)
+
+	def flush_fusion(self, now = None):
+		'''
+		pass on the best fix of each pilot whose fusion window is done.
+		Args:
+			now: time to judge the windows by; float('inf') passes on everything pending [time.time()]
+		'''
+		if self.pilot_fusion is None:
+			return
+		for fix, dropped in self.pilot_fusion.flush(time.time() if now is None else now):
+			for dropped_fix in dropped:
+				self.stats.count('fused', dropped_fix['srccall'], dropped_fix['receiver'])
+			if fix is not None:
+				self.select_fix(fix, fix['packet'])
 
 	def get_loc(self):
 		raise NotImplementedError
@@ -172,26 +317,45 @@ class APRSBase(object):
 		'''
 		pretty print some overall statistics
 		'''
-		self.logger.info('packet stats : %s', self.packet_stats)
+		snapshot = self.stats.snapshot()
+		self.logger.info('packet stats : %s', snapshot['per_id'])
+		# same again, machine readable - e.g. for the supervisor to aggregate over workers.
+		self.logger.info('packet stats json : %s', json.dumps(snapshot['per_id']))
+		self.logger.info('packet totals : %s', snapshot['totals'])
+		self.logger.info('packet rates (per sec, last %0.0f sec / ewma / lifetime) : %s', snapshot['window_sec'],
+			{k : '{:0.2f} / {:0.2f} / {:0.2f}'.format(v['window'], v['ewma'], v['lifetime']) for k, v in snapshot['rates'].items()})
+		self.logger.info('receiver stats : %s', snapshot['per_receiver'])
+		self.logger.info('sink stats : %s', {name : sink.snapshot() for name, sink in self.sink_by_name.items()})
 
 	def cleanup(self, **kwargs):
 		"""
 		any actions deemed prudent when stopping monitoring
 		"""
+		# hand over what's still waiting in fusion windows or locations, before the sinks drain and stop.
+		self.flush_fusion(float('inf'))
+		self.send_locations()
+		for sink in self.sink_by_name.values():
+			sink.close()
 		self.log_stats()
+		for uploader in self.uploader_by_name.values():
+			uploader.close()
 	
-	def monitor(self):
+	def monitor(self, max_run_time_sec = None):
 		"""
 		monitor the service every N seconds.
 		if failing, increase timeout (and notify user).
 		reset when successful.
-		abort on ctrl-c
+		abort on ctrl-c, or after max_run_time_sec if given (e.g. for soak testing).
 		"""
 		
 		self.start_time = time.time()
 		self.last_print = self.start_time
 		while True:
 			now = time.time()
+			if max_run_time_sec is not None and now - self.start_time > max_run_time_sec:
+				self.logger.info('stopping after %0.1f sec', now - self.start_time)
+				self.cleanup()
+				break
 			try:
 				self.get_loc()
 				self.send_locations()
@@ -223,33 +387,15 @@ class APRSBase(object):
 			except Exception as e:
 				self.logger.error('Failed to log misc info due to %s', e)
 	
-	def upload_packet_to_gpaero(self, json_dict):
-		"""
-		Uses the push method
-		there are other methods meant for higher frequency fixes - GlideTrak protocol.
-		i may branch these later to use those, or refactor the code a bit, or not bother - i suspect that as long as we're closer to a spot / inreach in terms of fix frequency, it all works well.
-		"""
-		if not _UPLOAD:
-			self.logger.info('would upload, but skipping %s', json_dict)
-			return
-		
-		self.logger.info('Uploading %s', json_dict)
-		# from BB's code
-		#curl -H "Accept: application/json" -H "Content-Type: application/json" -d @json_file http://glideport.aero/spot/ir_push.php
-		# Note that the user has to have added  ir_push:IMEI (With the/ a(?) correct IMEI)
-		
-		r = requests.post('http://glideport.aero/spot/ir_push.php', json=json_dict)
-		r.raise_for_status()
-		self.logger.info('Received %s', r.text)
-	
 	def send_locations(self):
 		"""
 		take locations
 		convert ids to IMEI
-		create json for uploading to gpaero
-		save json to local log file
-		send to gpaero.
-		clear the locations once uploaded
+		create events for uploading to gpaero
+		hand them to each sink (see sinks.py), which write them out on their own threads - by default just glideport,
+		via each pilot's uploader (see uploaders.py); the default ir_push one posts json to ir_push.php,
+		for higher frequency fixes an ir_push uploader with max_events_per_post posts a whole cycle at once.
+		clear the locations once handed over
 		
 		sample json file : 
 		{"Version": "2.0", "Events": [{
@@ -266,20 +412,27 @@ class APRSBase(object):
 
 
 		"""
+		self.flush_fusion()
 		if len(self.locations) > 0:
 			self.logger.debug('sending %0d locations', len(self.locations))
 		
+		now = time.monotonic()
 		for entry in self.locations:
 			try:
-				json_dict = {'Version' : 2.0,
-					'Events' : [{'imei' : self.ids_to_be_tracked[entry['srccall']],
-								'timeStamp' : int( 1000 * entry['time']),  #  seems BB's code converts to integer in msec, so copying that.
-								'point' : {'latitude' : entry['lat'], 'longitude' : entry['lng'], 'altitude' : entry['altitude']},},]
-					}
-				self.upload_packet_to_gpaero(json_dict)
+				event = {'imei' : self.ids_to_be_tracked[entry['srccall']],
+						'timeStamp' : int( 1000 * entry['time']),  #  seems BB's code converts to integer in msec, so copying that.
+						'point' : {'latitude' : entry['lat'], 'longitude' : entry['lng'], 'altitude' : entry['altitude']},}
 			except Exception as e:
-				self.logger.warning('send_locations failed due to *%s* raw : %s', e, entry)
+				self.upload_failed(entry, e)
+				continue
+			for sink in self.sink_by_name.values():
+				sink.put((now, entry, event))
 		self.locations = []
+
+	def upload_failed(self, entry, e):
+		# called on the sink threads; PacketStats takes care of the locking.
+		self.stats.count('upload_failed', entry.get('srccall', None), entry.get('receiver', None))
+		self.logger.warning('send_locations failed due to *%s* raw : %s', e, entry)
 		
 
 class APRSIS2GP(APRSBase):
@@ -305,6 +458,37 @@ class APRSIS2GP(APRSBase):
 		'''
 		return ppac
 
+	def fix_precision(self, ppac):
+		'''
+		horizontal error estimate used to pick between fixes when fusing; smaller is better.
+		Args:
+			ppac: a parsed packet (dictionary)
+		Returns:
+			estimate, or None if unknown - as is the case for plain aprs.
+		'''
+		return None
+
+	def fix_course(self, ppac):
+		'''
+		course over ground, used by decimation to spot turns.
+		Args:
+			ppac: a parsed packet (dictionary)
+		Returns:
+			degrees, or None if unknown; aprs uses 0 for unknown and 360 for north.
+		'''
+		course = ppac.get('course', None)
+		return course % 360 if course else None
+
+	def packet_receiver(self, ppac):
+		'''
+		who passed the packet on to aprs-is, for the per receiver stats.
+		Args:
+			ppac: a parsed packet (dictionary)
+		Returns:
+			the igate (aprslib's via), or None if unknown.
+		'''
+		return ppac.get('via', None) or None
+
 	def __init__(self, ids_to_be_tracked, callsign, **kwargs):
 		"""
 		ids : a dictionary of callsign : IMEI items.
@@ -324,7 +508,11 @@ class APRSIS2GP(APRSBase):
 		if len(packet) == 0:
 			return
 		try:
-			ppac = self.packet_parser(packet)
+			try:
+				ppac = self.packet_parser(packet)
+			except Exception:
+				self.stats.count('parse_failed')
+				raise
 			if ppac is None:
 				return
 			if _DEBUG or _LOG_ALL:
@@ -345,29 +533,28 @@ class APRSIS2GP(APRSBase):
 				# i can't gaurantee that we had an independent time stamp, so we'll just use the location information;
 				# this of couse is not guaranteed unitque, but i'm willing to accept the potential loss if one of the last few packets match exactly.
 				short_packet_data = '{:} {:} {:}'.format(ppac['longitude'], ppac['latitude'], ppac.get('altitude', 0))
+				receiver = self.packet_receiver(ppac)
 				# get timestamp from packet, if included - not common. (actually, not common for aprs, is common for flarm / ogn)
 				timestamp = ppac.get('timestamp', time.time())
 				if short_packet_data in self.recent_packets.get(ppac['from'], []):
-					self.packet_stats[ppac['from']]['duplicate'] += 1
+					self.stats.count('duplicate', ppac['from'], receiver)
 					self.logger.warning('Dropping duplicate of recent packet - %s', packet)
-				elif timestamp - self.last_packet_time.get(ppac['from'], 0) < self.min_packet_dt:
-					self.logger.warning('Got new packet too soon - %0.1f sec after last one, < %0.1f sec : %s', timestamp - self.last_packet_time.get(ppac['from'], 0), self.min_packet_dt, packet)
-					self.packet_stats[ppac['from']]['rate_limit'] += 1
 				else:
-					self.packet_stats[ppac['from']]['good'] += 1
-					self.last_packet_time[ppac['from']] = timestamp
-					# i seem to have an issue with OGN and daylight saving time.
-					# however, the place to fix it is post filtering / selection, so it's here - the default fix method is a passthrough.
-					# shift timestamp \after\ i save the recent packet time - so i only change what's uploaded, not the local time stamping.
-					timestamp= self.shift_time_based_on_local_dst(timestamp, ppac['latitude'], ppac['longitude'])
-					self.logger.info('Adding packet : %s', ppac)
-					self.locations.append({'srccall' : ppac['from'],
-								'lng' : ppac['longitude'],
-								'lat' : ppac['latitude'],
-								'altitude' : ppac.get('altitude', 0),  # exception, mostly for debugging, but i'm willing to accept trackers configured without altitude.
-								'time' : timestamp}) 
-					if _DEBUG or self.verbose:
-						self.logger.debug('after adding\n%s', self.locations)
+					fix = {'srccall' : ppac['from'],
+						'lng' : ppac['longitude'],
+						'lat' : ppac['latitude'],
+						'altitude' : ppac.get('altitude', 0),  # exception, mostly for debugging, but i'm willing to accept trackers configured without altitude.
+						'time' : timestamp,
+						'receiver' : receiver,
+						'course' : self.fix_course(ppac)}
+					if self.pilot_fusion is None:
+						self.select_fix(fix, packet)
+					else:
+						fix['precision'] = self.fix_precision(ppac)
+						fix['packet'] = packet
+						if not self.pilot_fusion.add(self.ids_to_be_tracked[ppac['from']], fix, time.time()):
+							self.logger.debug('Dropping packet older than the last one sent for this pilot : %s', packet)
+							self.stats.count('fused', ppac['from'], receiver)
 				# adding this packet to the recent ones held for the id, regardless of validity
 				self.recent_packets[ppac['from']].append(short_packet_data)
 
@@ -402,26 +589,40 @@ class APRSIS2GPRAW(APRSIS2GP):
 		print_info_every_x_seconds: period over which to print a bit more detailed recent count etc info [1.0]
 		calculate_mean_window_sec: winodw over which we calculate recent rate [60]
 		max_consecutive_data_loss: reset connections if we got no packets this many times [3]
+		server_filter: ask the server to only send our ids (needs a filtered port, e.g. 14580), rather than filtering the full feed here [False]
+		max_silence_sec: with server_filter, quiet is normal (the server sends keepalives every ~20 sec), so reset only after this long without any data [60.0]
 	"""
 
 	version = 0.01
 	sock_block_len = 2**14
+	# ids are matched by callsign as is; see OGN2GPAero for sources whose callsigns wrap the id.
+	server_filter_prefixes = ('',)
 	
-	def __init__(self, ids_to_be_tracked, callsign, addr = '45.63.21.153', port = 10152, print_info_every_x_seconds = 1.0, calculate_mean_window_sec = 60, max_consecutive_data_loss = 3, **kwargs):
+	def __init__(self, ids_to_be_tracked, callsign, addr = '45.63.21.153', port = 10152, print_info_every_x_seconds = 1.0, calculate_mean_window_sec = 60, max_consecutive_data_loss = 3, server_filter = False, max_silence_sec = 60.0, **kwargs):
 		self.addr = addr
 		self.port = port
 		self.print_info_every_x_seconds = print_info_every_x_seconds
 		self.calculate_mean_window_sec = calculate_mean_window_sec
 		self.max_consecutive_data_loss =  max_consecutive_data_loss
+		self.server_filter = server_filter
+		self.max_silence_sec = max_silence_sec
 		super(APRSIS2GPRAW, self).__init__(ids_to_be_tracked, callsign, **kwargs)
 		self.logger.info('Connecting to %s:%s', self.addr, self.port)
 
 	def reset(self):
 		super().reset()
 		self._buffer = ''
-		self._total_N_packets = 0
-		self._packet_count_bubffer = deque([], maxlen = 1000) # use to calculate mean rates; should be deep enough that we exclude based on age, but limit to avoid memory issues.
+		self.last_info_print = time.monotonic()
 		self.data_loss_counter = 0
+		self.last_data_time = time.time()
+
+	def login_filter(self):
+		'''
+		filter appended to the login line when server_filter is set - a budlist of our ids.
+		'''
+		if not self.server_filter:
+			return ''
+		return ' filter b/' + '/'.join(prefix + x for x in self.ids_to_be_tracked for prefix in self.server_filter_prefixes)
 
 	def prepare_connection(self, **kwargs):
 		self.raw_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -433,13 +634,15 @@ class APRSIS2GPRAW(APRSIS2GP):
 		time.sleep(0.1)
 		# casualty of 2 to 3 conversion; this is no longer ok (whether it ever was a good idea is another question)
 		#self.raw_socket.sendall(b'user {:} pass -1 vers {:} {:}\n\r'.format(self.callsign, self.__class__.__name__, self.version))
-		self.raw_socket.sendall(bytearray('user {:} pass -1 vers {:} {:}\n\r'.format(self.callsign, self.__class__.__name__, self.version),encoding="utf-8", errors="strict"))
+		self.raw_socket.sendall(bytearray('user {:} pass -1 vers {:} {:}{:}\n\r'.format(self.callsign, self.__class__.__name__, self.version, self.login_filter()),encoding="utf-8", errors="strict"))
 		self.logger.info('ack : *%s*', self.raw_socket.recv(10000).decode('utf-8').split('\r\n')[0])
 		self.raw_socket.settimeout(kwargs.get('socket_timeout', self.wait_between_checks * 2))  # fudge factor.
+		self.last_data_time = time.time()
 	
 	def cleanup(self, **kwargs):
-		super(APRSIS2GPRAW, self).cleanup(**kwargs)
+		# stop taking data first, then let the sinks drain.
 		self.close_connection()
+		super(APRSIS2GPRAW, self).cleanup(**kwargs)
 	
 	def close_connection(self):
 		self.logger.info('closing socket')
@@ -448,23 +651,30 @@ class APRSIS2GPRAW(APRSIS2GP):
 	def get_loc(self):
 		try:
 			# we're going to drop stuff with non utf-8 chars later, but we shouldn't drop other legit packets.
-			pre_data = (self._buffer + self.raw_socket.recv(self.sock_block_len).decode('utf-8', errors = 'ignore')).split('\r\n')
+			chunk = self.raw_socket.recv(self.sock_block_len)
+			if len(chunk) > 0:
+				self.last_data_time = time.time()
+			pre_data = (self._buffer + chunk.decode('utf-8', errors = 'ignore')).split('\r\n')
 			# if last line is an exact packet, this wil shift its processing one cycle later; seems acceptable.
 			self._buffer = pre_data[-1]
 			data = pre_data[:-1]
-			now = time.time()
-			# add the recent count, then filter
-			self._packet_count_bubffer.append((len(data), time.time()))
-			while time.time() - self._packet_count_bubffer[0][1] > self.calculate_mean_window_sec:
-				self._packet_count_bubffer.popleft()
-			self.logger.debug('%0d packets in mean rate calculation buffer', len(self._packet_count_bubffer))
-			self._total_N_packets += len(data)
-			if now - self.last_print > self.print_info_every_x_seconds:
-				self.last_print = now
-				self.logger.info('Got %0d packets, overall mean rate %0.2f packets / sec over %0d sec, over last %0.1f sec mean rate = %0.2f packets / sec', len(data), self._total_N_packets / (time.time() - self.start_time), time.time() - self.start_time, self.calculate_mean_window_sec, sum([x[0] for x in self._packet_count_bubffer]) /  (self._packet_count_bubffer[-1][1] - self._packet_count_bubffer[0][1]))
+			# count first, then filter; one clock read serves the counters and the info print.
+			now = time.monotonic()
+			self.stats.count('received', n = len(data), now = now)
+			if now - self.last_info_print > self.print_info_every_x_seconds:
+				self.last_info_print = now
+				rates = self.stats.rates(now)['received']
+				self.logger.info('Got %0d packets, overall mean rate %0.2f packets / sec over %0d sec, over last %0.1f sec mean rate = %0.2f packets / sec (ewma %0.2f)', len(data), rates['lifetime'], now - self.stats.started_at, self.calculate_mean_window_sec, rates['window'], rates['ewma'])
 			for packet_i, packet in enumerate(data):
 				self.filter_callsigns(packet, packet_i = packet_i)
-			if len(data) < 2: # 1?
+			if self.server_filter:
+				# a filtered feed is mostly quiet; only a closed connection or a long silence (no keepalives either) is a problem.
+				if len(chunk) == 0 or time.time() - self.last_data_time > self.max_silence_sec:
+					self.logger.error('connection closed or silent for > %0.1f sec, resetting socket', self.max_silence_sec)
+					self.close_connection()
+					time.sleep(1.0)
+					self.prepare_connection()
+			elif len(data) < 2: # 1?
 				self.data_loss_counter += 1
 				self.logger.warning('Got no data for last %0d cycles', self.data_loss_counter)
 				if self.data_loss_counter >= self.max_consecutive_data_loss:
@@ -474,6 +684,11 @@ class APRSIS2GPRAW(APRSIS2GP):
 					self.prepare_connection()
 			else:
 				self.data_loss_counter = 0
+		except socket.timeout as e:
+			if self.server_filter and time.time() - self.last_data_time <= self.max_silence_sec:
+				return
+			self.logger.error('Socket exception %s, resetting connection', e)
+			self.prepare_connection()
 		except socket.error as e:
 			self.logger.error('Socket exception %s, resetting connection', e)
 			# we could try closing it, but i'm not sure there's much point - let GC handle that.
@@ -555,6 +770,7 @@ optional {:}'''.format(_USABLE_KEYWORDS))
 	callsign = config.pop('callsign')
 	
 	c = APRSIS2GPRAW(ids_to_be_tracked, callsign, **config)
+	stop_on_signals()
 	c.monitor()
 
 if __name__ == '__main__':
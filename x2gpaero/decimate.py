@@ -0,0 +1,149 @@
+"""
+track aware decimation of fixes before they are uploaded.
+
+the min_packet_dt approach simply drops anything that arrives too soon after the last accepted fix,
+which for ~1Hz flarm tracks means turns get cut at arbitrary points while straight glides are over sampled.
+here we decide per pilot based on geometry - heading change, distance, altitude change, with a max gap keepalive.
+the heading is the course reported in the packet when there is one; otherwise the bearing over the last
+min_heading_distance_m or more of track, since over a single ~1 sec step (18 m at the 0.01 minute aprs resolution)
+it would be mostly noise.
+state is O(1) per pilot: the last accepted fix, the last fix seen, and where the current heading segment started.
+"""
+
+import math
+
+_EARTH_RADIUS_M = 6371008.8
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+	'''
+	great circle (haversine) distance between two points
+	Args:
+		lat1, lng1: first point, degrees
+		lat2, lng2: second point, degrees
+	Returns:
+		distance, meters
+	'''
+	phi1 = math.radians(lat1)
+	phi2 = math.radians(lat2)
+	dphi = phi2 - phi1
+	dlambda = math.radians(lng2 - lng1)
+	a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+	return 2 * _EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bearing_deg(lat1, lng1, lat2, lng2):
+	'''
+	initial bearing from point 1 to point 2
+	Returns:
+		bearing, degrees in [0, 360)
+	'''
+	phi1 = math.radians(lat1)
+	phi2 = math.radians(lat2)
+	dlambda = math.radians(lng2 - lng1)
+	y = math.sin(dlambda) * math.cos(phi2)
+	x = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(dlambda)
+	return math.degrees(math.atan2(y, x)) % 360.0
+
+
+def heading_difference_deg(h1, h2):
+	'''
+	smallest absolute difference between two headings, degrees in [0, 180]
+	'''
+	d = abs(h1 - h2) % 360.0
+	return 360.0 - d if d > 180.0 else d
+
+
+class TrackDecimator(object):
+	'''
+	incremental decimation of a single pilot's track.
+	a fix is accepted if at least min_dt has passed since the last accepted one, and any of:
+		- max_gap_sec has passed since the last accepted fix (keepalive)
+		- we moved more than max_distance_m since the last accepted fix
+		- the altitude changed by more than max_altitude_change_m
+		- the heading changed by more than max_heading_change_deg vs the heading at the last accepted fix;
+		  only checked once we've moved at least min_heading_distance_m, so gps jitter on the ground doesn't count as a turn.
+	fixes not newer than the last one seen (out of order, or repeated) are ignored.
+	Args:
+		min_dt: never accept fixes closer than this, seconds [1.0]
+		max_gap_sec: keepalive, seconds [30.0]
+		max_distance_m: [1000.0]
+		max_altitude_change_m: [50.0]
+		max_heading_change_deg: [20.0]
+		min_heading_distance_m: also the shortest segment a heading is computed over, if the packets don't report one [100.0]
+	'''
+
+	def __init__(self, min_dt = 1.0, max_gap_sec = 30.0, max_distance_m = 1000.0, max_altitude_change_m = 50.0, max_heading_change_deg = 20.0, min_heading_distance_m = 100.0):
+		self.min_dt = min_dt
+		self.max_gap_sec = max_gap_sec
+		self.max_distance_m = max_distance_m
+		self.max_altitude_change_m = max_altitude_change_m
+		self.max_heading_change_deg = max_heading_change_deg
+		self.min_heading_distance_m = min_heading_distance_m
+		self.reset()
+
+	def reset(self):
+		# (lat, lng, altitude, time) tuples, or None
+		self.last_accepted = None
+		self.last_seen = None
+		# heading at the last accepted fix, None if unknown (e.g. first fix)
+		self.last_accepted_heading = None
+		# (lat, lng) where the current heading segment starts, and the heading of the last complete segment
+		self.segment_start = None
+		self.segment_heading = None
+
+	def _heading(self, lat, lng, course):
+		'''
+		current heading - the reported course, or the bearing of the latest segment of at least min_heading_distance_m; None if unknown.
+		'''
+		if course is not None:
+			return course
+		if self.segment_start is None:
+			self.segment_start = (lat, lng)
+		elif distance_m(self.segment_start[0], self.segment_start[1], lat, lng) >= self.min_heading_distance_m:
+			self.segment_heading = bearing_deg(self.segment_start[0], self.segment_start[1], lat, lng)
+			self.segment_start = (lat, lng)
+		return self.segment_heading
+
+	def update(self, lat, lng, altitude, timestamp, course = None):
+		'''
+		offer a new fix.
+		Args:
+			lat, lng: degrees
+			altitude: meters
+			timestamp: seconds
+			course: reported course over ground, degrees, or None if the packet doesn't have one [None]
+		Returns:
+			reason string ('first', 'gap', 'distance', 'altitude', 'heading') if the fix should be uploaded, otherwise None
+		'''
+		if self.last_seen is not None and timestamp <= self.last_seen[3]:
+			return None
+		heading = self._heading(lat, lng, course)
+		reason = self._decide(lat, lng, altitude, timestamp, heading)
+		if reason is not None:
+			self.last_accepted = (lat, lng, altitude, timestamp)
+			self.last_accepted_heading = heading
+		elif self.last_accepted_heading is None and heading is not None:
+			# we didn't know which way we were going when the last fix was accepted; the first real heading after it is the best estimate.
+			self.last_accepted_heading = heading
+		self.last_seen = (lat, lng, altitude, timestamp)
+		return reason
+
+	def _decide(self, lat, lng, altitude, timestamp, heading):
+		if self.last_accepted is None:
+			return 'first'
+		a_lat, a_lng, a_alt, a_time = self.last_accepted
+		dt = timestamp - a_time
+		if dt < self.min_dt:
+			return None
+		if dt >= self.max_gap_sec:
+			return 'gap'
+		d = distance_m(a_lat, a_lng, lat, lng)
+		if d >= self.max_distance_m:
+			return 'distance'
+		if abs(altitude - a_alt) >= self.max_altitude_change_m:
+			return 'altitude'
+		if heading is not None and self.last_accepted_heading is not None and d >= self.min_heading_distance_m:
+			if heading_difference_deg(heading, self.last_accepted_heading) >= self.max_heading_change_deg:
+				return 'heading'
+		return None
@@ -0,0 +1,96 @@
+"""
+pilot level fusion of fixes from several trackers / receivers.
+
+a pilot is an IMEI; every id in ids_to_be_tracked that maps to the same IMEI is a source for that pilot.
+e.g. a flarm heard by several ogn receivers, plus an aprs tracker, all end up as one stream per pilot.
+fixes of a pilot whose time stamps match (within time_tolerance_sec) are the same moment seen by several sources;
+they are held for a short window after the first one arrives, and the best one is passed on.
+fixes with different time stamps are passed on separately, so a single tracker's consecutive fixes are never merged -
+rate limiting is left to min_packet_dt / decimation.
+anything not newer than what we already passed on for the pilot is dropped, which dedupes across sources
+in a way the exact string recent_packets check can't.
+"""
+
+_PREFERENCES = ('recency', 'precision')
+
+
+class PilotFusion(object):
+	'''
+	Args:
+		window_sec: how long to collect fixes of the same moment before picking one [2.0]
+		time_tolerance_sec: fixes whose time stamps are this close are the same moment [0.5]
+		prefer: 'recency' picks the fix with the latest time stamp, 'precision' the one with the smallest horizontal error estimate;
+			the other is used to break ties ['recency']
+	fixes are dictionaries with at least 'srccall' and 'time', and optionally 'precision' (smaller is better, None if unknown).
+	'''
+
+	def __init__(self, window_sec = 2.0, prefer = 'recency', time_tolerance_sec = 0.5):
+		if prefer not in _PREFERENCES:
+			raise ValueError('prefer must be one of {:}, got {:}'.format(_PREFERENCES, prefer))
+		self.window_sec = window_sec
+		self.prefer = prefer
+		self.time_tolerance_sec = time_tolerance_sec
+		self.reset()
+
+	def reset(self):
+		# pilot : list of windows, one per moment - [window opened at, time stamp of the first fix, best fix so far, list of fixes that lost]
+		self.pending = {}
+		# pilot : time stamp of the last fix passed on
+		self.last_emitted_time = {}
+
+	def _rank(self, fix):
+		precision = fix.get('precision', None)
+		precision = float('inf') if precision is None else precision
+		if self.prefer == 'recency':
+			return (fix['time'], -precision)
+		return (-precision, fix['time'])
+
+	def add(self, pilot, fix, now):
+		'''
+		offer a fix for a pilot.
+		Args:
+			pilot: pilot key, i.e. IMEI
+			fix: dictionary, see class docstring
+			now: current (local) time, seconds; windows are timed by arrival, not by fix time stamps.
+		Returns:
+			True if the fix was taken into a window, False if it is stale (not newer than the last fix passed on).
+		'''
+		if fix['time'] - self.last_emitted_time.get(pilot, float('-inf')) <= self.time_tolerance_sec:
+			return False
+		windows = self.pending.setdefault(pilot, [])
+		for entry in windows:
+			if abs(fix['time'] - entry[1]) <= self.time_tolerance_sec:
+				if self._rank(fix) > self._rank(entry[2]):
+					entry[3].append(entry[2])
+					entry[2] = fix
+				else:
+					entry[3].append(fix)
+				return True
+		windows.append([now, fix['time'], fix, []])
+		return True
+
+	def flush(self, now):
+		'''
+		close the windows that are due; pass now = float('inf') to close all of them, e.g. when stopping.
+		a due window also closes the pilot's windows for earlier moments, so fixes are passed on in time order.
+		Returns:
+			list of (best fix, list of the fixes it replaced) for each closed window;
+			best fix is None if the whole window turned out to be stale.
+		'''
+		out = []
+		for pilot in list(self.pending.keys()):
+			windows = self.pending[pilot]
+			due = [entry[1] for entry in windows if now - entry[0] >= self.window_sec]
+			if len(due) == 0:
+				continue
+			closed = sorted([entry for entry in windows if entry[1] <= max(due)], key = lambda entry : entry[2]['time'])
+			windows[:] = [entry for entry in windows if entry[1] > max(due)]
+			if len(windows) == 0:
+				del self.pending[pilot]
+			for _, _, best, dropped in closed:
+				if best['time'] - self.last_emitted_time.get(pilot, float('-inf')) <= self.time_tolerance_sec:
+					out.append((None, dropped + [best]))
+					continue
+				self.last_emitted_time[pilot] = best['time']
+				out.append((best, dropped))
+		return out
@@ -12,7 +12,7 @@ import argparse
 from datetime import datetime
 from timezonefinder import TimezoneFinderL
 from pytz import timezone
-from x2gpaero.aprs2gp import APRSIS2GPRAW, config_file_reader, _USABLE_KEYWORDS
+from x2gpaero.aprs2gp import APRSIS2GPRAW, config_file_reader, stop_on_signals, _USABLE_KEYWORDS
 from ogn.parser import parse as ogn_parse
 from ogn.parser import ParseError as OGNParseError
 from ogn.client import settings as ogn_settings
@@ -34,6 +34,8 @@ class OGN2GPAero(APRSIS2GPRAW):
 	"""
 
 	sock_block_len = 2**14
+	# the callsign wraps the address, e.g. FLRDDA5BA
+	server_filter_prefixes = ('FLR', 'ICA', 'OGN')
 
 	# i don't want to pay the startup time; i could have one per trace, but it's annoying, and loading all to memory should mean that we've predone the optimization.
 	tf = TimezoneFinderL(in_memory=True)
@@ -71,6 +73,37 @@ class OGN2GPAero(APRSIS2GPRAW):
 			d['timestamp'] = d['timestamp'].timestamp()
 		return d
 
+	def fix_precision(self, ppac):
+		'''
+		flarm / ogn trackers report gps quality as e.g. gps2x3 - horizontal x vertical; use the horizontal part.
+		Args:
+			ppac: OGN parsed packet (dictionary)
+		Returns:
+			horizontal estimate, or None if the packet doesn't carry one.
+		'''
+		gps_quality = ppac.get('gps_quality', None)
+		if isinstance(gps_quality, dict):
+			return gps_quality.get('horizontal', None)
+		return None
+
+	def fix_course(self, ppac):
+		'''
+		Args:
+			ppac: OGN parsed packet (dictionary)
+		Returns:
+			track, degrees, or None if the packet doesn't carry one.
+		'''
+		return ppac.get('track', None)
+
+	def packet_receiver(self, ppac):
+		'''
+		Args:
+			ppac: OGN parsed packet (dictionary)
+		Returns:
+			the ogn receiver that heard the packet.
+		'''
+		return ppac.get('receiver_name', None)
+
 	def packet_post_id_filter(self, parsed_packet):
 		'''
 		filter a packet that already is matched to an id based based receiver or address type
@@ -115,6 +148,7 @@ optional {:}'''.format(_OGN_USABLE_KEYWORDS))
 	config = config_file_reader(args.config)
 	ids_to_be_tracked = config.pop('ids')
 	c = OGN2GPAero(ids_to_be_tracked, **config)
+	stop_on_signals()
 	c.monitor()
 
 if __name__ == '__main__':
@@ -0,0 +1,282 @@
+"""
+outputs for the fixes that made it through filtering.
+
+every sink has its own bounded queue and thread, so a slow or dead output never holds up the others, or the feed:
+put() never blocks, and when a queue is full the oldest fixes are dropped (a fresh fix is worth more than a stale one).
+items are (enqueue time, location entry, ir_push style event), see APRSBase.send_locations.
+
+* GlideportSink - uploads via the gateway's uploaders (see uploaders.py).
+* JSONLSink - appends one flat json record per fix to a file; the name can hold strftime fields for rotation, e.g. fixes_%Y_%m_%d.jsonl.
+  the records are flat on purpose, so e.g. pandas.read_json(lines = True) or pyarrow can turn them into parquet offline.
+* UDPSink - one json datagram per fix, to a (possibly broadcast) address.
+* TCPSink - listens, and sends one json line per fix to every connected client, e.g. a local dashboard.
+"""
+
+import json
+import time
+import socket
+import logging
+import threading
+from collections import deque
+
+
+class Sink(object):
+	'''
+	base class: queue, batching and the worker thread; subclasses implement write().
+	Args:
+		name: for logging and stats
+		queue_size: max fixes waiting; beyond that the oldest are dropped [10000]
+		batch_size: max fixes handed to write() at once [100]
+		linger_sec: wait this long for a batch to fill before writing; 0 writes whatever is there [0.0]
+	'''
+
+	def __init__(self, name, queue_size = 10000, batch_size = 100, linger_sec = 0.0):
+		self.name = name
+		self.queue_size = queue_size
+		self.batch_size = batch_size
+		self.linger_sec = linger_sec
+		self.logger = logging.getLogger('X2GP')
+		self.queue = deque()
+		self.condition = threading.Condition()
+		self.running = True
+		self.started_at = time.monotonic()
+		self.stats = {'queued' : 0, 'written' : 0, 'failed' : 0, 'dropped' : 0, 'batches' : 0, 'latency_sum' : 0.0, 'latency_max' : 0.0}
+		self.thread = threading.Thread(target = self._run, name = 'sink_{:}'.format(name), daemon = True)
+		self.thread.start()
+
+	def put(self, item):
+		with self.condition:
+			if len(self.queue) >= self.queue_size:
+				self.queue.popleft()
+				self.stats['dropped'] += 1
+			self.queue.append(item)
+			self.stats['queued'] += 1
+			self.condition.notify()
+
+	def _next_batch(self):
+		with self.condition:
+			while self.running and len(self.queue) == 0:
+				self.condition.wait()
+			if self.linger_sec > 0:
+				deadline = time.monotonic() + self.linger_sec
+				while self.running and len(self.queue) < self.batch_size and time.monotonic() < deadline:
+					self.condition.wait(deadline - time.monotonic())
+			return [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+
+	def _run(self):
+		while True:
+			batch = self._next_batch()
+			if len(batch) == 0:
+				# only when stopping with nothing left
+				break
+			try:
+				failed = self.write(batch)
+			except Exception as e:
+				failed = [(i, e) for i in range(len(batch))]
+			now = time.monotonic()
+			self.stats['batches'] += 1
+			self.stats['failed'] += len(failed)
+			self.stats['written'] += len(batch) - len(failed)
+			for item in batch:
+				latency = now - item[0]
+				self.stats['latency_sum'] += latency
+				self.stats['latency_max'] = max(self.stats['latency_max'], latency)
+			for i, e in failed:
+				self.on_failed(batch[i], e)
+
+	def write(self, batch):
+		'''
+		Args:
+			batch: list of (enqueue time, entry, event)
+		Returns:
+			list of (index into batch, exception) for the fixes that weren't written.
+		'''
+		raise NotImplementedError
+
+	def on_failed(self, item, e):
+		self.logger.warning('sink %s failed due to *%s* raw : %s', self.name, e, item[1])
+
+	def snapshot(self):
+		'''
+		throughput and latency (enqueue to written, seconds) so far.
+		'''
+		stats = dict(self.stats)
+		handled = stats['written'] + stats['failed']
+		stats['latency_mean'] = stats.pop('latency_sum') / handled if handled > 0 else 0.0
+		stats['written_per_sec'] = stats['written'] / max(time.monotonic() - self.started_at, 1e-9)
+		stats['queue'] = len(self.queue)
+		return stats
+
+	def close(self, timeout = 10.0):
+		'''
+		write out what's queued (up to timeout), then stop.
+		'''
+		with self.condition:
+			self.running = False
+			self.condition.notify_all()
+		self.thread.join(timeout)
+
+
+class GlideportSink(Sink):
+	'''
+	upload through the gateway's uploaders.
+	Args:
+		uploader_by_name: dictionary of name : Uploader
+		uploader_for: callable srccall -> uploader name
+		on_upload_failed: callable (entry, exception), e.g. for per id stats [None]
+		upload: False only logs what would be uploaded [True]
+	'''
+
+	def __init__(self, name, uploader_by_name, uploader_for, on_upload_failed = None, upload = True, **kwargs):
+		self.uploader_by_name = uploader_by_name
+		self.uploader_for = uploader_for
+		self.on_upload_failed = on_upload_failed
+		self.upload = upload
+		super(GlideportSink, self).__init__(name, **kwargs)
+
+	def write(self, batch):
+		# uploader name : list of indices into batch
+		by_uploader = {}
+		for i, item in enumerate(batch):
+			by_uploader.setdefault(self.uploader_for(item[1]['srccall']), []).append(i)
+		failed = []
+		for uploader_name, indices in by_uploader.items():
+			events = [batch[i][2] for i in indices]
+			if not self.upload:
+				self.logger.info('would upload via %s, but skipping %s', uploader_name, events)
+				continue
+			# an uploader that raises only fails its own fixes, not the ones the others already delivered.
+			try:
+				failed.extend((indices[j], e) for j, e in self.uploader_by_name[uploader_name].upload(events))
+			except Exception as e:
+				failed.extend((i, e) for i in indices)
+		return failed
+
+	def on_failed(self, item, e):
+		if self.on_upload_failed is not None:
+			self.on_upload_failed(item[1], e)
+		else:
+			super(GlideportSink, self).on_failed(item, e)
+
+
+def flat_record(item):
+	'''
+	one flat dictionary per fix, shared by the file and network sinks.
+	'''
+	_, entry, event = item
+	return {'id' : entry['srccall'], 'imei' : event['imei'], 'time' : entry['time'],
+		'lat' : entry['lat'], 'lng' : entry['lng'], 'altitude' : entry['altitude']}
+
+
+class JSONLSink(Sink):
+	'''
+	Args:
+		path: file name, may contain strftime fields (evaluated in utc per batch) for rotation
+		linger_sec: defaults to 1 sec here, so writes are batched [1.0]
+	'''
+
+	def __init__(self, name, path, linger_sec = 1.0, **kwargs):
+		self.path = path
+		super(JSONLSink, self).__init__(name, linger_sec = linger_sec, **kwargs)
+
+	def write(self, batch):
+		with open(time.strftime(self.path, time.gmtime()), 'a') as f:
+			f.write(''.join(json.dumps(flat_record(item)) + '\n' for item in batch))
+		return []
+
+
+class UDPSink(Sink):
+	'''
+	Args:
+		host: destination, may be a broadcast address
+		port: destination port
+	'''
+
+	def __init__(self, name, host, port, **kwargs):
+		self.address = (host, port)
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+		super(UDPSink, self).__init__(name, **kwargs)
+
+	def write(self, batch):
+		failed = []
+		for i, item in enumerate(batch):
+			try:
+				self.sock.sendto(json.dumps(flat_record(item)).encode('utf-8'), self.address)
+			except OSError as e:
+				failed.append((i, e))
+		return failed
+
+	def close(self, timeout = 10.0):
+		super(UDPSink, self).close(timeout)
+		self.sock.close()
+
+
+class TCPSink(Sink):
+	'''
+	serve fixes as json lines to whoever connects; clients that can't keep up (send_timeout) are dropped.
+	nobody connected counts as written - the fixes were offered.
+	Args:
+		host: listen address ['127.0.0.1']
+		port: listen port
+		send_timeout: seconds [1.0]
+	'''
+
+	def __init__(self, name, port, host = '127.0.0.1', send_timeout = 1.0, **kwargs):
+		self.send_timeout = send_timeout
+		self.clients = []
+		self.clients_lock = threading.Lock()
+		self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.server_socket.bind((host, port))
+		self.server_socket.listen(8)
+		threading.Thread(target = self._accept, name = 'sink_{:}_accept'.format(name), daemon = True).start()
+		super(TCPSink, self).__init__(name, **kwargs)
+
+	def _accept(self):
+		while True:
+			try:
+				conn, addr = self.server_socket.accept()
+			except OSError:
+				break
+			conn.settimeout(self.send_timeout)
+			self.logger.info('sink %s : client %s connected', self.name, addr)
+			with self.clients_lock:
+				self.clients.append(conn)
+
+	def write(self, batch):
+		data = ''.join(json.dumps(flat_record(item)) + '\n' for item in batch).encode('utf-8')
+		with self.clients_lock:
+			clients = list(self.clients)
+		for conn in clients:
+			try:
+				conn.sendall(data)
+			except OSError as e:
+				self.logger.info('sink %s : dropping client due to %s', self.name, e)
+				with self.clients_lock:
+					self.clients.remove(conn)
+				conn.close()
+		return []
+
+	def close(self, timeout = 10.0):
+		super(TCPSink, self).close(timeout)
+		self.server_socket.close()
+		with self.clients_lock:
+			for conn in self.clients:
+				conn.close()
+			self.clients = []
+
+
+SINKS = {'glideport' : GlideportSink, 'jsonl' : JSONLSink, 'udp' : UDPSink, 'tcp' : TCPSink}
+
+
+def make_sink(name, sink_type = 'glideport', **kwargs):
+	'''
+	Args:
+		name: sink name
+		sink_type: one of SINKS
+		kwargs: passed on to the sink
+	'''
+	if sink_type not in SINKS:
+		raise ValueError('unknown sink type {:}, expected one of {:}'.format(sink_type, list(SINKS.keys())))
+	return SINKS[sink_type](name, **kwargs)
@@ -0,0 +1,715 @@
+#!/usr/bin/python3
+"""
+end to end soak testing, without touching the public servers.
+
+starts two local stand-ins, and runs the real gateway classes against them:
+* FakeAPRSISServer - speaks enough of the aprs-is login handshake, then replays a capture (e.g. aprs2gpaero_all_packet.log)
+  or synthetic traffic at a multiple of the nominal rate, with optional stalls and disconnects.
+* FakeGlideportServer - accepts ir_push.php style posts, with configurable latency and error rate,
+  and optionally a StreamUploader style tcp endpoint.
+
+reports sustained throughput, fix age at upload (p50 / p99), drops by reason and memory growth.
+fix age is measured from the moment the fake server sent the packet, so it includes the socket, parsing, filtering and upload path.
+
+e.g.
+	x2gpaero-soak --duration 7200 --rate 100 --multiplier 5 --stall_every_sec 600 --disconnect_every_sec 1800 --error_rate 0.05
+"""
+
+import os
+import re
+import time
+import math
+import json
+import random
+import socket
+import logging
+import resource
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def rss_bytes():
+	'''
+	current resident set size; falls back to the peak if /proc isn't around.
+	'''
+	try:
+		with open('/proc/self/statm', 'r') as f:
+			return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+	except (OSError, ValueError, IndexError):
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def position_key(latitude, longitude):
+	'''
+	key used to match an uploaded point with the packet we sent; 4 decimals is finer than the 0.01 minute aprs resolution needs to be distinct.
+	'''
+	return (round(latitude, 4), round(longitude, 4))
+
+
+def aprs_lat_lng(latitude, longitude):
+	'''
+	format a position as aprs ddmm.mmN / dddmm.mmE strings.
+	Returns:
+		(lat string, lng string, latitude, longitude) - the last two rounded the way the receiver will see them.
+	'''
+	def fmt(value, width, pos, neg):
+		hemisphere = pos if value >= 0 else neg
+		value = abs(value)
+		deg = int(value)
+		minutes = round((value - deg) * 60, 2)
+		if minutes >= 60:
+			deg, minutes = deg + 1, 0.0
+		return '{:0{w}d}{:05.2f}{:}'.format(deg, minutes, hemisphere, w = width), (deg + minutes / 60.0) * (1 if hemisphere == pos else -1)
+	lat_s, lat = fmt(latitude, 2, 'N', 'S')
+	lng_s, lng = fmt(longitude, 3, 'E', 'W')
+	return lat_s, lng_s, lat, lng
+
+
+class SyntheticTraffic(object):
+	'''
+	endless supply of packets: tracked pilots flying circles with a fix every fix_interval_sec, buried in background traffic.
+	Args:
+		ids_to_be_tracked: dictionary of id : IMEI, the pilots we generate
+		ogn: generate ogn flavoured flarm beacons instead of plain aprs [False]
+		fix_interval_sec: nominal time between fixes for each pilot [1.0]
+	'''
+
+	def __init__(self, ids_to_be_tracked, ogn = False, fix_interval_sec = 1.0):
+		self.ids = list(ids_to_be_tracked.keys())
+		self.ogn = ogn
+		self.fix_interval_sec = fix_interval_sec
+		self.pilots = [{'lat0' : 35.0 + 0.1 * i, 'lng0' : -118.0 - 0.1 * i, 'phase' : random.random() * 2 * math.pi, 'alt' : 1500.0} for i in range(len(self.ids))]
+		self.next_fix = [0.0] * len(self.ids)
+		self.background_i = 0
+
+	def _packet(self, src, lat, lng, course, speed_kt, alt_m, now, tracked):
+		lat_s, lng_s, lat, lng = aprs_lat_lng(lat, lng)
+		hms = time.strftime('%H%M%S', time.gmtime(now))
+		alt_ft = int(alt_m / 0.3048)
+		if self.ogn:
+			# address type 2 (flarm), receiver names chosen so they aren't on the reject list.
+			packet = 'FLR{:}>OGFLR,qAS,FAKERX{:0d}:/{:}h{:}/{:}\'{:03d}/{:03d}/A={:06d} !W00! id06{:} +000fpm +0.0rot 10.0dB 0e +0.0kHz gps2x3'.format(src, self.background_i % 7, hms, lat_s, lng_s, course, speed_kt, alt_ft, src)
+		else:
+			packet = '{:}>APRS,TCPIP*,qAC,FAKE:@{:}h{:}/{:}\'{:03d}/{:03d}/A={:06d}'.format(src, hms, lat_s, lng_s, course, speed_kt, alt_ft)
+		return packet, (position_key(lat, lng) if tracked else None)
+
+	def next_packets(self, n, now, speedup = 1.0):
+		'''
+		Args:
+			n: total number of packets wanted
+			now: current time, seconds since epoch
+			speedup: pilots fix faster by this factor, so the tracked share of traffic scales with the replay rate.
+		Returns:
+			list of (packet, position key or None for background traffic)
+		'''
+		out = []
+		for i, src in enumerate(self.ids):
+			if len(out) >= n or now < self.next_fix[i]:
+				continue
+			self.next_fix[i] = now + self.fix_interval_sec / speedup
+			p = self.pilots[i]
+			# ~30 m/s circle of ~1km radius, slowly climbing
+			angle = p['phase'] + now * speedup * 0.03
+			lat = p['lat0'] + 0.009 * math.cos(angle)
+			lng = p['lng0'] + 0.009 * math.sin(angle) / math.cos(math.radians(p['lat0']))
+			course = int(math.degrees(angle + math.pi / 2)) % 360 or 360
+			p['alt'] += 0.1
+			out.append(self._packet(src, lat, lng, course, 58, p['alt'], now, True))
+		while len(out) < n:
+			self.background_i += 1
+			src = '{:06X}'.format(0x100000 + self.background_i % 5000) if self.ogn else 'BG{:04d}-{:0d}'.format(self.background_i % 5000, self.background_i % 16)
+			lat = 20.0 + (self.background_i * 0.137) % 40
+			lng = -120.0 + (self.background_i * 0.291) % 100
+			out.append(self._packet(src, lat, lng, 90, 20, 300.0, now, False))
+		return out
+
+
+class CaptureTraffic(object):
+	'''
+	replay a recorded raw packet log, looping at the end.
+	packets from tracked ids are keyed for fix age using their parsed position, if parse is given; everything else is background.
+	position time stamps (hhmmss h, or ddhhmm z) are rewritten to the send time, otherwise every pass after the first
+	would go back in time and be rate limited.
+	Args:
+		filename: raw packet log, one packet per line
+		ids_to_be_tracked: dictionary of id : IMEI, the ids whose packets are keyed
+		parse: packet parser, e.g. aprslib.parse or ogn.parser.parse [None]
+	'''
+
+	def __init__(self, filename, ids_to_be_tracked, parse = None):
+		with open(filename, 'r', errors = 'ignore') as f:
+			self.lines = [x.strip() for x in f if len(x.strip()) > 0]
+		if len(self.lines) == 0:
+			raise ValueError('no packets in {:}'.format(filename))
+		self.ids = set(ids_to_be_tracked.keys())
+		self.parse = parse
+		self.i = 0
+
+	# start of the info field of a position report with a time stamp
+	_timestamp_re = re.compile(r'^([^:]*:[/@])(\d{6})([hz])')
+
+	@classmethod
+	def _restamp(cls, packet, now):
+		def stamp(m):
+			return m.group(1) + time.strftime('%H%M%S' if m.group(3) == 'h' else '%d%H%M', time.gmtime(now)) + m.group(3)
+		return cls._timestamp_re.sub(stamp, packet, count = 1)
+
+	def _key(self, packet):
+		if self.parse is None:
+			return None
+		try:
+			d = self.parse(packet)
+		except Exception:
+			return None
+		# ogn packets carry the id as the address, aprs ones as the source callsign; see OGN2GPAero.packet_parser.
+		if d is None or d.get('from', d.get('address', None)) not in self.ids:
+			return None
+		return position_key(d['latitude'], d['longitude'])
+
+	def next_packets(self, n, now, speedup = 1.0):
+		'''
+		Returns:
+			list of (packet, position key or None for background traffic)
+		'''
+		out = []
+		for _ in range(n):
+			packet = self._restamp(self.lines[self.i], now)
+			self.i = (self.i + 1) % len(self.lines)
+			out.append((packet, self._key(packet)))
+		return out
+
+
+class FakeAPRSISServer(object):
+	'''
+	minimal local aprs-is stand in.
+	one feed is generated and fanned out to every connected client, honouring a budlist (filter b/...) sent at login,
+	with keepalives for quiet clients, as a real server would.
+	Args:
+		traffic: SyntheticTraffic or CaptureTraffic
+		rate: nominal packets / sec [100.0]
+		multiplier: replay at this multiple of the nominal rate [1.0]
+		stall_every_sec, stall_sec: every so often, stop the feed for a while [None, 10.0]
+		disconnect_every_sec: drop each client after it's been connected this long [None]
+		port: 0 picks a free one
+	'''
+
+	tick_sec = 0.05
+	keepalive_sec = 20.0
+	# a client this far behind is dropped, like a real server does with slow readers.
+	max_client_queue = 100000
+
+	def __init__(self, traffic, rate = 100.0, multiplier = 1.0, stall_every_sec = None, stall_sec = 10.0, disconnect_every_sec = None, host = '127.0.0.1', port = 0):
+		self.traffic = traffic
+		self.rate = rate
+		self.multiplier = multiplier
+		self.stall_every_sec = stall_every_sec
+		self.stall_sec = stall_sec
+		self.disconnect_every_sec = disconnect_every_sec
+		self.logger = logging.getLogger('X2GPSOAK.aprsis')
+		self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.server_socket.bind((host, port))
+		self.server_socket.listen(16)
+		self.addr, self.port = self.server_socket.getsockname()
+		self.running = False
+		self.lock = threading.Lock()
+		# client id : {'queue' : deque of packets, 'budlist' : list of callsign patterns or None}
+		self.clients = {}
+		self._next_client = 0
+		# position key : send time, pruned by age so a multi hour run doesn't grow it.
+		self.sent_at = {}
+		self._sent_order = deque()
+		self.stats = {'connections' : 0, 'sent' : 0, 'sent_tracked' : 0, 'stalls' : 0, 'disconnects' : 0, 'slow_clients' : 0}
+
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target = self._serve, daemon = True)
+		self.thread.start()
+		threading.Thread(target = self._produce, daemon = True).start()
+		return self
+
+	def stop(self):
+		self.running = False
+		self.server_socket.close()
+
+	def send_time(self, latitude, longitude):
+		with self.lock:
+			return self.sent_at.get(position_key(latitude, longitude), None)
+
+	def _remember(self, key, now):
+		# called with the lock held
+		self.sent_at[key] = now
+		self._sent_order.append((now, key))
+		while self._sent_order and now - self._sent_order[0][0] > 600:
+			_, old_key = self._sent_order.popleft()
+			if self.sent_at.get(old_key, now) <= now - 600:
+				del self.sent_at[old_key]
+
+	@staticmethod
+	def _matches(packet, budlist):
+		if budlist is None:
+			return True
+		src = packet.split('>', 1)[0]
+		return any(src == x or (x.endswith('*') and src.startswith(x[:-1])) for x in budlist)
+
+	def _produce(self):
+		last_stall = time.time()
+		owed = 0.0
+		while self.running:
+			now = time.time()
+			if self.stall_every_sec is not None and now - last_stall > self.stall_every_sec:
+				self.stats['stalls'] += 1
+				self.logger.info('injecting %0.1f sec stall', self.stall_sec)
+				time.sleep(self.stall_sec)
+				last_stall = time.time()
+				continue
+			owed += self.rate * self.multiplier * self.tick_sec
+			n = int(owed)
+			owed -= n
+			if n > 0:
+				packets = self.traffic.next_packets(n, now, speedup = self.multiplier)
+				with self.lock:
+					for packet, key in packets:
+						delivered = False
+						for client in self.clients.values():
+							if self._matches(packet, client['budlist']):
+								client['queue'].append(packet)
+								delivered = True
+						if delivered:
+							self.stats['sent'] += 1
+							if key is not None:
+								self._remember(key, now)
+								self.stats['sent_tracked'] += 1
+			time.sleep(max(0.0, self.tick_sec - (time.time() - now)))
+
+	def _serve(self):
+		while self.running:
+			try:
+				conn, _ = self.server_socket.accept()
+			except OSError:
+				break
+			self.stats['connections'] += 1
+			threading.Thread(target = self._handle_client, args = (conn,), daemon = True).start()
+
+	def _handle_client(self, conn):
+		client_id = None
+		try:
+			client_id = self._handle(conn)
+		except OSError as e:
+			self.logger.info('client went away : %s', e)
+		finally:
+			with self.lock:
+				self.clients.pop(client_id, None)
+			conn.close()
+
+	def _handle(self, conn):
+		conn.sendall(b'# aprsc 2.1.4 fake\r\n')
+		conn.settimeout(10)
+		login = b''
+		while b'\n' not in login:
+			chunk = conn.recv(1024)
+			if len(chunk) == 0:
+				return None
+			login += chunk
+		words = login.decode('utf-8', errors = 'ignore').split()
+		callsign = words[1]
+		budlist = None
+		if 'filter' in words:
+			budlist = []
+			for f in words[words.index('filter') + 1:]:
+				if f.startswith('b/'):
+					budlist.extend(x for x in f[2:].split('/') if len(x) > 0)
+		conn.sendall('# logresp {:} unverified, server FAKE\r\n'.format(callsign).encode('utf-8'))
+		# give the client a moment to read the ack on its own, as a real server's first data doesn't follow instantly.
+		time.sleep(0.2)
+		queue = deque()
+		with self.lock:
+			client_id = self._next_client
+			self._next_client += 1
+			self.clients[client_id] = {'queue' : queue, 'budlist' : budlist}
+		start = time.time()
+		last_sent = start
+		while self.running:
+			now = time.time()
+			if self.disconnect_every_sec is not None and now - start > self.disconnect_every_sec:
+				self.stats['disconnects'] += 1
+				self.logger.info('injecting disconnect')
+				return client_id
+			if len(queue) > self.max_client_queue:
+				self.stats['slow_clients'] += 1
+				self.logger.info('dropping slow client')
+				return client_id
+			packets = []
+			while len(queue) > 0:
+				packets.append(queue.popleft())
+			if len(packets) > 0:
+				conn.sendall(''.join(x + '\r\n' for x in packets).encode('utf-8'))
+				last_sent = now
+			elif now - last_sent > self.keepalive_sec:
+				conn.sendall(time.strftime('# aprsc 2.1.4 fake %d %b %Y %H:%M:%S GMT FAKE 127.0.0.1:14580\r\n', time.gmtime(now)).encode('utf-8'))
+				last_sent = now
+			time.sleep(self.tick_sec)
+		return client_id
+
+
+class LatencyHistogram(object):
+	'''
+	fixed bins, so percentiles over a multi hour run cost constant memory.
+	'''
+
+	def __init__(self, bin_sec = 0.01, max_sec = 300.0):
+		self.bin_sec = bin_sec
+		self.bins = [0] * (int(max_sec / bin_sec) + 1)
+		self.count = 0
+
+	def add(self, value):
+		self.bins[min(len(self.bins) - 1, max(0, int(value / self.bin_sec)))] += 1
+		self.count += 1
+
+	def percentile(self, p):
+		if self.count == 0:
+			return float('nan')
+		target = p / 100.0 * self.count
+		acc = 0
+		for i, c in enumerate(self.bins):
+			acc += c
+			if acc >= target:
+				return (i + 0.5) * self.bin_sec
+		return len(self.bins) * self.bin_sec
+
+
+class _CountingFile(object):
+	'''
+	wraps a socket file, counting bytes through it; everything else is passed on.
+	'''
+
+	def __init__(self, f, count):
+		self._f = f
+		self._count = count
+
+	def read(self, *args):
+		data = self._f.read(*args)
+		self._count(len(data))
+		return data
+
+	def readline(self, *args):
+		data = self._f.readline(*args)
+		self._count(len(data))
+		return data
+
+	def write(self, data):
+		self._count(len(data))
+		return self._f.write(data)
+
+	def __getattr__(self, name):
+		return getattr(self._f, name)
+
+
+class FakeGlideportServer(object):
+	'''
+	local stand in for ir_push.php, and optionally for a StreamUploader endpoint.
+	bytes_in / bytes_out count everything at the http (or stream) level, headers included.
+	Args:
+		latency_sec: added to every request [0.0]
+		error_rate: fraction of requests answered with a 500 [0.0]
+		send_time: callable (latitude, longitude) -> time the packet was sent, or None; otherwise the fix time stamp is used for fix age.
+		stream: also listen for streamed fixes, on stream_port [False]
+	'''
+
+	path = '/spot/ir_push.php'
+
+	def __init__(self, latency_sec = 0.0, error_rate = 0.0, send_time = None, host = '127.0.0.1', port = 0, stream = False):
+		self.latency_sec = latency_sec
+		self.error_rate = error_rate
+		self.send_time = send_time
+		self.lock = threading.Lock()
+		self.stats = {'received' : 0, 'accepted' : 0, 'errors_injected' : 0, 'bad_requests' : 0, 'bytes_in' : 0, 'bytes_out' : 0}
+		self.fix_age = LatencyHistogram()
+		self.per_imei = {}
+		owner = self
+
+		class Handler(BaseHTTPRequestHandler):
+
+			def setup(self):
+				super().setup()
+				self.rfile = _CountingFile(self.rfile, lambda n : owner._count('bytes_in', n))
+				self.wfile = _CountingFile(self.wfile, lambda n : owner._count('bytes_out', n))
+
+			def do_POST(self):
+				body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+				owner._handle(self, body)
+
+			def log_message(self, *args):
+				pass
+
+		self.httpd = ThreadingHTTPServer((host, port), Handler)
+		self.httpd.daemon_threads = True
+		self.addr, self.port = self.httpd.server_address[:2]
+		self.stream_socket = None
+		if stream:
+			self.stream_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			self.stream_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			self.stream_socket.bind((host, 0))
+			self.stream_socket.listen(4)
+			self.stream_port = self.stream_socket.getsockname()[1]
+
+	def _count(self, key, n):
+		with self.lock:
+			self.stats[key] += n
+
+	@property
+	def url(self):
+		return 'http://{:}:{:}{:}'.format(self.addr, self.port, self.path)
+
+	def start(self):
+		self.thread = threading.Thread(target = self.httpd.serve_forever, daemon = True)
+		self.thread.start()
+		if self.stream_socket is not None:
+			threading.Thread(target = self._serve_stream, daemon = True).start()
+		return self
+
+	def stop(self):
+		self.httpd.shutdown()
+		self.httpd.server_close()
+		if self.stream_socket is not None:
+			self.stream_socket.close()
+
+	def _serve_stream(self):
+		while True:
+			try:
+				conn, _ = self.stream_socket.accept()
+			except OSError:
+				break
+			threading.Thread(target = self._handle_stream, args = (conn,), daemon = True).start()
+
+	def _handle_stream(self, conn):
+		buffer = b''
+		events = []
+		with conn:
+			while True:
+				try:
+					data = conn.recv(2**16)
+				except OSError:
+					break
+				if len(data) == 0:
+					break
+				now = time.time()
+				self._count('bytes_in', len(data))
+				lines = (buffer + data).split(b'\r\n')
+				buffer = lines[-1]
+				for line in lines[:-1]:
+					if len(line) > 0:
+						try:
+							imei, timestamp, lat, lng, alt = line.decode('utf-8').split(',')
+							events.append({'imei' : imei, 'timeStamp' : int(timestamp), 'point' : {'latitude' : float(lat), 'longitude' : float(lng), 'altitude' : float(alt)}})
+						except ValueError:
+							self._count('bad_requests', 1)
+						continue
+					# end of batch; answer it as a relay would, once it has (or hasn't) passed the fixes on.
+					self._count('received', len(events))
+					if self.latency_sec > 0:
+						time.sleep(self.latency_sec)
+					if random.random() < self.error_rate:
+						self._count('errors_injected', 1)
+						reply = b'ERR\r\n'
+					else:
+						self.record(events, now)
+						reply = 'OK {:0d}\r\n'.format(len(events)).encode('utf-8')
+					self._count('bytes_out', len(reply))
+					try:
+						conn.sendall(reply)
+					except OSError:
+						return
+					events = []
+
+	def _reply(self, handler, code, text):
+		handler.send_response(code)
+		handler.send_header('Content-Type', 'text/plain')
+		handler.end_headers()
+		handler.wfile.write(text.encode('utf-8'))
+
+	def _handle(self, handler, body):
+		now = time.time()
+		if self.latency_sec > 0:
+			time.sleep(self.latency_sec)
+		self._count('received', 1)
+		if random.random() < self.error_rate:
+			self._count('errors_injected', 1)
+			self._reply(handler, 500, 'injected error')
+			return
+		try:
+			events = json.loads(body.decode('utf-8'))['Events']
+		except (ValueError, KeyError):
+			self._count('bad_requests', 1)
+			self._reply(handler, 400, 'bad request')
+			return
+		self.record(events, now)
+		self._reply(handler, 200, 'OK')
+
+	def record(self, events, now):
+		'''
+		account for accepted fixes; events as in the ir_push json.
+		'''
+		with self.lock:
+			for event in events:
+				self.stats['accepted'] += 1
+				self.per_imei[event['imei']] = self.per_imei.get(event['imei'], 0) + 1
+				sent = None if self.send_time is None else self.send_time(event['point']['latitude'], event['point']['longitude'])
+				self.fix_age.add(now - (sent if sent is not None else event['timeStamp'] / 1000.0))
+
+
+class SoakReport(object):
+	'''
+	collect and print the numbers we care about, periodically and at the end.
+	'''
+
+	def __init__(self, gateway, aprsis, glideport):
+		self.gateway = gateway
+		self.aprsis = aprsis
+		self.glideport = glideport
+		self.logger = logging.getLogger('X2GPSOAK')
+		self.start = time.time()
+		self.rss_start = rss_bytes()
+		self.rss_max = self.rss_start
+
+	def snapshot(self):
+		now = time.time()
+		elapsed = max(now - self.start, 1e-9)
+		rss = rss_bytes()
+		self.rss_max = max(self.rss_max, rss)
+		gateway_stats = self.gateway.stats.snapshot()
+		drops = gateway_stats['totals']
+		received = drops.pop('received')
+		# parse failures are over the whole feed, not just tracked ids, so they're reported on their own.
+		parse_failed = drops.pop('parse_failed')
+		good = drops.pop('good')
+		# whatever the server sent for tracked ids and the gateway never counted - parse failures, resets, partial buffers.
+		drops['lost_before_filter'] = max(0, self.aprsis.stats['sent_tracked'] - good - sum(v for k, v in drops.items() if k != 'upload_failed'))
+		return {'elapsed_sec' : elapsed,
+			'packets_sent' : self.aprsis.stats['sent'],
+			'packets_received' : received,
+			'throughput_pps' : received / elapsed,
+			'recent_pps' : gateway_stats['rates']['received']['window'],
+			'parse_failed' : parse_failed,
+			'good' : good,
+			'uploads_accepted' : self.glideport.stats['accepted'],
+			'uploads_per_sec' : self.glideport.stats['accepted'] / elapsed,
+			'fix_age_p50_sec' : self.glideport.fix_age.percentile(50),
+			'fix_age_p99_sec' : self.glideport.fix_age.percentile(99),
+			'drops' : drops,
+			'server' : dict(self.aprsis.stats),
+			'glideport' : dict(self.glideport.stats),
+			'sinks' : {name : sink.snapshot() for name, sink in self.gateway.sink_by_name.items()},
+			'rss_mb' : rss / 2**20,
+			'rss_growth_mb' : (rss - self.rss_start) / 2**20,
+			'rss_growth_mb_per_hour' : (rss - self.rss_start) / 2**20 * 3600.0 / elapsed,
+			'rss_max_mb' : self.rss_max / 2**20}
+
+	def log(self):
+		s = self.snapshot()
+		self.logger.info('soak %0.0f sec : %0.1f pps in (%0.1f recent), %0.2f uploads / sec, fix age p50 %0.2f p99 %0.2f sec, drops %s, rss %0.1f MB (%+0.1f MB / h)',
+			s['elapsed_sec'], s['throughput_pps'], s['recent_pps'], s['uploads_per_sec'], s['fix_age_p50_sec'], s['fix_age_p99_sec'], s['drops'], s['rss_mb'], s['rss_growth_mb_per_hour'])
+		return s
+
+
+def run_soak(gateway_class, ids_to_be_tracked, duration = 600.0, report_every_sec = 60.0, capture = None, ogn = False, rate = 100.0, multiplier = 1.0,
+		stall_every_sec = None, stall_sec = 10.0, disconnect_every_sec = None, latency_sec = 0.0, error_rate = 0.0, fix_interval_sec = 1.0, uploader = 'ir_push', **gateway_kwargs):
+	'''
+	run a gateway class against local fake servers for a while.
+	Args:
+		gateway_class: e.g. APRSIS2GPRAW or OGN2GPAero
+		ids_to_be_tracked: dictionary of id : IMEI
+		duration: seconds
+		report_every_sec: periodic report
+		capture: raw packet log to replay instead of synthetic traffic [None]
+		uploader: 'ir_push' or 'stream' - which fake glideport endpoint the gateway uploads to ['ir_push']
+		gateway_kwargs: passed on to the gateway, e.g. min_packet_dt or decimation
+	Returns:
+		final report dictionary
+	'''
+	if capture is not None:
+		if ogn:
+			from ogn.parser import parse
+		else:
+			from aprslib import parse
+		traffic = CaptureTraffic(capture, ids_to_be_tracked, parse = parse)
+	else:
+		traffic = SyntheticTraffic(ids_to_be_tracked, ogn = ogn, fix_interval_sec = fix_interval_sec)
+	aprsis = FakeAPRSISServer(traffic, rate = rate, multiplier = multiplier, stall_every_sec = stall_every_sec, stall_sec = stall_sec, disconnect_every_sec = disconnect_every_sec).start()
+	glideport = FakeGlideportServer(latency_sec = latency_sec, error_rate = error_rate, send_time = aprsis.send_time, stream = (uploader == 'stream')).start()
+	gateway_kwargs.setdefault('callsign', 'N0CALL')
+	if uploader == 'stream':
+		# stream isn't a production protocol, see uploaders.py; the fake glideport is the relay here.
+		from x2gpaero.uploaders import RELAY_UPLOADERS
+		gateway_class = type(gateway_class.__name__, (gateway_class,), {'upload_protocols' : RELAY_UPLOADERS})
+		gateway_kwargs['uploaders'] = {'stream' : {'protocol' : 'stream', 'host' : glideport.addr, 'port' : glideport.stream_port}}
+		gateway_kwargs['default_uploader'] = 'stream'
+	gateway = gateway_class(ids_to_be_tracked, addr = aprsis.addr, port = aprsis.port, upload_url = glideport.url, **gateway_kwargs)
+	# the gateway logs every upload and rate limited packet; that's noise at soak rates.
+	if not gateway_kwargs.get('verbose', False):
+		logging.getLogger('X2GP').setLevel(logging.ERROR)
+	report = SoakReport(gateway, aprsis, glideport)
+
+	stop = threading.Event()
+
+	def periodic():
+		while not stop.wait(report_every_sec):
+			try:
+				report.log()
+			except Exception as e:
+				report.logger.error('report failed due to %s', e)
+
+	reporter = threading.Thread(target = periodic, daemon = True)
+	reporter.start()
+	try:
+		gateway.monitor(max_run_time_sec = duration)
+	finally:
+		stop.set()
+		final = report.log()
+		aprsis.stop()
+		glideport.stop()
+	return final
+
+
+def main():
+	parser = argparse.ArgumentParser(description = '''
+soak test the gateway against a local fake aprs-is server and a fake glideport endpoint.
+''', formatter_class = argparse.RawTextHelpFormatter)
+	parser.add_argument('--ogn', action = 'store_true', help = 'run OGN2GPAero with ogn traffic, otherwise APRSIS2GPRAW')
+	parser.add_argument('--config', type = str, default = None, help = 'gateway json config, as for aprs2gpaero / ogn2gpaero; ids default to synthetic pilots')
+	parser.add_argument('--pilots', type = int, default = 10, help = 'number of synthetic pilots if no ids are configured')
+	parser.add_argument('--capture', type = str, default = None, help = 'raw packet log to replay, instead of synthetic traffic')
+	parser.add_argument('--duration', type = float, default = 600.0, help = 'seconds')
+	parser.add_argument('--report_every_sec', type = float, default = 60.0)
+	parser.add_argument('--rate', type = float, default = 100.0, help = 'nominal packets / sec')
+	parser.add_argument('--multiplier', type = float, default = 1.0, help = 'replay at this multiple of the nominal rate')
+	parser.add_argument('--fix_interval_sec', type = float, default = 1.0, help = 'synthetic pilots nominal fix interval')
+	parser.add_argument('--stall_every_sec', type = float, default = None)
+	parser.add_argument('--stall_sec', type = float, default = 10.0)
+	parser.add_argument('--disconnect_every_sec', type = float, default = None)
+	parser.add_argument('--latency_sec', type = float, default = 0.0, help = 'fake glideport latency')
+	parser.add_argument('--error_rate', type = float, default = 0.0, help = 'fake glideport error fraction')
+	parser.add_argument('--uploader', type = str, default = 'ir_push', choices = ['ir_push', 'stream'], help = 'upload protocol the gateway uses')
+	args = parser.parse_args()
+
+	if args.ogn:
+		from x2gpaero.ogn2gp import OGN2GPAero as gateway_class
+	else:
+		from x2gpaero.aprs2gp import APRSIS2GPRAW as gateway_class
+	config = {'wait_between_checks' : 0.15}
+	if args.config is not None:
+		from x2gpaero.aprs2gp import config_file_reader
+		config.update(config_file_reader(args.config))
+	ids_to_be_tracked = config.pop('ids', None)
+	if ids_to_be_tracked is None:
+		ids_to_be_tracked = {('DD{:04X}'.format(i) if args.ogn else 'SOAK{:0d}-9'.format(i)) : 'SOAKIMEI{:0d}'.format(i) for i in range(args.pilots)}
+	final = run_soak(gateway_class, ids_to_be_tracked, duration = args.duration, report_every_sec = args.report_every_sec, capture = args.capture, ogn = args.ogn,
+		rate = args.rate, multiplier = args.multiplier, stall_every_sec = args.stall_every_sec, stall_sec = args.stall_sec, disconnect_every_sec = args.disconnect_every_sec,
+		latency_sec = args.latency_sec, error_rate = args.error_rate, fix_interval_sec = args.fix_interval_sec, uploader = args.uploader, **config)
+	print(json.dumps(final, indent = 1))
+
+
+if __name__ == '__main__':
+	main()
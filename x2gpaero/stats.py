@@ -0,0 +1,153 @@
+"""
+packet statistics that are cheap to keep up to date and cheap to read.
+
+* SlidingWindowRate - events / sec over the last window_sec, from a ring of time buckets; O(1) per update and read.
+* EWMARate - exponentially weighted events / sec, with time constant tau_sec; O(1), two numbers of state.
+* PacketStats - lifetime counters (good, duplicate, rate_limit, ...) in total, per id and per receiver,
+  plus rates for the feed and for good packets; snapshot() is what log_stats and any exporter read.
+all times are time.monotonic(), so wall clock jumps (ntp on a pi that just booted) don't produce silly rates.
+PacketStats is thread safe - upload failures are counted on the sink threads, and e.g. the soak report reads from its own.
+"""
+
+import math
+import time
+import threading
+
+# per id / per receiver counters; parse_failed only makes sense in the totals, as we don't know who sent it.
+COUNTERS = ('good', 'rate_limit', 'duplicate', 'decimated', 'fused', 'upload_failed')
+TOTAL_ONLY_COUNTERS = ('received', 'parse_failed')
+
+
+class SlidingWindowRate(object):
+	'''
+	Args:
+		window_sec: [60.0]
+		n_buckets: resolution of the window [60]
+		now: start time, monotonic seconds [time.monotonic()]
+	'''
+
+	def __init__(self, window_sec = 60.0, n_buckets = 60, now = None):
+		self.window_sec = float(window_sec)
+		self.n_buckets = n_buckets
+		self.bucket_sec = self.window_sec / n_buckets
+		self.buckets = [0] * n_buckets
+		self.total = 0
+		self.started_at = time.monotonic() if now is None else now
+		self.bucket_i = 0
+
+	def _advance(self, now):
+		bucket_i = int((now - self.started_at) / self.bucket_sec)
+		# clearing at most a full ring, however long we've been idle.
+		for i in range(self.bucket_i + 1, min(bucket_i, self.bucket_i + self.n_buckets) + 1):
+			j = i % self.n_buckets
+			self.total -= self.buckets[j]
+			self.buckets[j] = 0
+		self.bucket_i = max(self.bucket_i, bucket_i)
+
+	def add(self, n, now):
+		self._advance(now)
+		self.buckets[self.bucket_i % self.n_buckets] += n
+		self.total += n
+
+	def rate(self, now):
+		'''
+		events / sec over the window, or over the time since start while that's shorter than the window.
+		'''
+		self._advance(now)
+		# the ring holds n_buckets - 1 full buckets plus the current, partly filled one, i.e. everything since the start of the
+		# oldest bucket still in it (or since start, early on); never divide by less than one bucket, e.g. right after a reset.
+		since_start = now - self.started_at
+		span = min(since_start, since_start - (self.bucket_i - self.n_buckets + 1) * self.bucket_sec)
+		return self.total / max(span, self.bucket_sec)
+
+
+class EWMARate(object):
+	'''
+	Args:
+		tau_sec: time constant; the rate mostly reflects the last ~tau_sec [60.0]
+		now: start time, monotonic seconds [time.monotonic()]
+	'''
+
+	def __init__(self, tau_sec = 60.0, now = None):
+		self.tau_sec = float(tau_sec)
+		self.value = 0.0
+		self.last = time.monotonic() if now is None else now
+
+	def add(self, n, now):
+		self.value = self.rate(now) + n / self.tau_sec
+		self.last = max(self.last, now)
+
+	def rate(self, now):
+		return self.value * math.exp(-max(0.0, now - self.last) / self.tau_sec)
+
+
+class PacketStats(object):
+	'''
+	Args:
+		ids: the ids to keep per id counters for
+		window_sec: sliding window for the rates, also used as the ewma time constant [60.0]
+	per_id is a plain dictionary of id : counters, i.e. what packet_stats always was.
+	'''
+
+	rate_counters = ('received', 'good')
+
+	def __init__(self, ids, window_sec = 60.0):
+		now = time.monotonic()
+		self.lock = threading.Lock()
+		self.started_at = now
+		self.window_sec = window_sec
+		self.per_id = {k : dict.fromkeys(COUNTERS, 0) for k in ids}
+		self.per_receiver = {}
+		self.totals = dict.fromkeys(TOTAL_ONLY_COUNTERS + COUNTERS, 0)
+		self.windowed = {k : SlidingWindowRate(window_sec, now = now) for k in self.rate_counters}
+		self.ewma = {k : EWMARate(window_sec, now = now) for k in self.rate_counters}
+
+	def count(self, counter, srccall = None, receiver = None, n = 1, now = None):
+		'''
+		Args:
+			counter: one of COUNTERS or TOTAL_ONLY_COUNTERS
+			srccall: id, if known and tracked
+			receiver: receiving station (igate / ogn receiver), if known
+			n: how many
+			now: monotonic time, if the caller already has it
+		'''
+		if counter in self.windowed and now is None:
+			now = time.monotonic()
+		with self.lock:
+			self.totals[counter] += n
+			if srccall in self.per_id:
+				self.per_id[srccall][counter] += n
+			if receiver is not None:
+				per_receiver = self.per_receiver.get(receiver, None)
+				if per_receiver is None:
+					per_receiver = self.per_receiver[receiver] = dict.fromkeys(COUNTERS, 0)
+				per_receiver[counter] += n
+			if counter in self.windowed:
+				self.windowed[counter].add(n, now)
+				self.ewma[counter].add(n, now)
+
+	def rates(self, now = None):
+		'''
+		Returns:
+			dictionary of counter : {'window' : events / sec over window_sec, 'ewma' : ..., 'lifetime' : ...}
+		'''
+		now = time.monotonic() if now is None else now
+		with self.lock:
+			return self._rates(now)
+
+	def _rates(self, now):
+		elapsed = max(now - self.started_at, 1e-9)
+		return {k : {'window' : self.windowed[k].rate(now), 'ewma' : self.ewma[k].rate(now), 'lifetime' : self.totals[k] / elapsed} for k in self.rate_counters}
+
+	def snapshot(self, now = None):
+		'''
+		copy of everything, for logging / exporting; costs O(ids + receivers), not O(history).
+		'''
+		now = time.monotonic() if now is None else now
+		with self.lock:
+			return {'elapsed_sec' : now - self.started_at,
+				'window_sec' : self.window_sec,
+				'totals' : dict(self.totals),
+				'rates' : self._rates(now),
+				'per_id' : {k : dict(v) for k, v in self.per_id.items()},
+				'per_receiver' : {k : dict(v) for k, v in self.per_receiver.items()}}
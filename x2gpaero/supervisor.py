@@ -0,0 +1,419 @@
+#!/usr/bin/python3
+"""
+run the fleet as several shards, each with its own worker process (local, or on another host over ssh),
+rather than one gateway owning all the ids.
+
+* ids are split over the shards by consistent hashing, so adding ids (or shards) only moves a few of them.
+  the hash is of the IMEI, so all ids of a pilot end up in the same worker, where fusion can merge them.
+* a worker that dies is restarted right away (backing off if it keeps dying); only its shard's ids are uncovered meanwhile.
+* the config file is watched; when ids change, only the shards whose id set changed get a new worker,
+  started before the old one is stopped.
+* workers log their packet_stats as json (see APRSBase.log_stats); these are aggregated and logged here.
+  a worker that dies takes the counts since its last report with it, so workers report more often than we log,
+  and the logged totals say how much was missed.
+
+the config is the usual gateway json, plus:
+	gateway: 'aprs' or 'ogn' ['aprs']
+	shards: list of shard names, or of {"name": ..., "host": ...} for remote workers [["local"]]
+	ssh: command used to reach remote hosts [["ssh", "-tt", "-o", "BatchMode=yes"]]
+remote hosts need x2gpaero installed (the aprs2gpaero / ogn2gpaero entry points), and ssh needs to keep -tt, see ShardWorker.command.
+since each worker only has a handful of ids, it's worth setting server_filter (with a filtered port, e.g. 14580),
+so each worker gets its own server side filtered connection instead of the full feed.
+sinks that own a local resource are made unique per shard (see shard_sinks): jsonl paths get the shard name,
+tcp ports are offset by the shard's position in shards.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import bisect
+import hashlib
+import logging
+import tempfile
+import argparse
+import threading
+import subprocess
+from x2gpaero.aprs2gp import config_file_reader
+
+_GATEWAYS = {'aprs' : ('x2gpaero.aprs2gp', 'aprs2gpaero'),
+	'ogn' : ('x2gpaero.ogn2gp', 'ogn2gpaero')}
+
+_STATS_MARKER = 'packet stats json : '
+# a remote worker prints this once its terminal is quiet, and then reads its config from the terminal
+_CONFIG_PROMPT = 'x2gpaero config please'
+
+
+class ConsistentHashRing(object):
+	'''
+	map keys onto shards; each shard gets vnodes points on the ring, so the split stays even and
+	adding / removing a shard only moves the keys next to its points.
+	'''
+
+	def __init__(self, shards, vnodes = 64):
+		self.ring = sorted((self._hash('{:}#{:0d}'.format(shard, i)), shard) for shard in shards for i in range(vnodes))
+		self.points = [x[0] for x in self.ring]
+
+	@staticmethod
+	def _hash(key):
+		return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+	def shard_for(self, key):
+		i = bisect.bisect(self.points, self._hash(key)) % len(self.points)
+		return self.ring[i][1]
+
+	def split(self, ids):
+		'''
+		Args:
+			ids: dictionary of id : IMEI
+		Returns:
+			dictionary of shard : dictionary of id : IMEI (shards without ids are left out); ids sharing an IMEI share a shard.
+		'''
+		out = {}
+		for k, v in ids.items():
+			out.setdefault(self.shard_for(v), {})[k] = v
+		return out
+
+
+class ShardWorker(object):
+	'''
+	one gateway process for one shard.
+	Args:
+		name: shard name
+		config: complete gateway config for this shard, ids included
+		gateway: 'aprs' or 'ogn'
+		host: run over ssh on this host, or locally if None
+		ssh: ssh command, as a list
+		on_stats: callable (ShardWorker, packet_stats dictionary)
+	'''
+
+	def __init__(self, name, config, gateway = 'aprs', host = None, ssh = ('ssh', '-tt', '-o', 'BatchMode=yes'), on_stats = None):
+		self.name = name
+		self.config = config
+		self.gateway = gateway
+		self.host = host
+		self.ssh = list(ssh)
+		self.on_stats = on_stats
+		self.logger = logging.getLogger('X2GPSUPERVISOR.{:}'.format(name))
+		self.proc = None
+		self.config_filename = None
+		self.started_at = 0.0
+		# when its stats last came in
+		self.last_report = 0.0
+		self.restarts = 0
+		self.failures_in_a_row = 0
+		self.next_start = 0.0
+
+	def command(self):
+		module, entry_point = _GATEWAYS[self.gateway]
+		if self.host is None:
+			fd, self.config_filename = tempfile.mkstemp(prefix = 'x2gpaero_{:}_'.format(self.name), suffix = '.json')
+			with os.fdopen(fd, 'w') as f:
+				json.dump(self.config, f)
+			return [sys.executable, '-m', module, self.config_filename]
+		# the config holds the shard's IMEIs, so it goes neither on a command line (anyone can see those in ps) nor in a file there:
+		# the worker reads it from its terminal, see send_config. -tt gives it one, which also makes it go away with the connection
+		# (the gateway stops cleanly on the hang up), and lets stop() send it a ctrl-c. exec keeps the gateway the terminal's only job.
+		remote = 'stty -echo; echo {:}; exec {:} /dev/stdin'.format(_CONFIG_PROMPT, entry_point)
+		return self.ssh + [self.host, remote]
+
+	def send_config(self, proc):
+		'''
+		type the config into a remote worker's terminal: short lines, as the terminal only takes ~4k per line, then ctrl-d for the end.
+		'''
+		try:
+			proc.stdin.write(json.dumps(self.config, indent = 1) + '\n\x04')
+			proc.stdin.flush()
+		except OSError as e:
+			self.logger.warning('could not send the config due to %s', e)
+
+	def start(self):
+		cmd = self.command()
+		self.logger.info('starting worker for %0d ids%s', len(self.config['ids']), '' if self.host is None else ' on {:}'.format(self.host))
+		self.proc = subprocess.Popen(cmd, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, stdin = subprocess.DEVNULL if self.host is None else subprocess.PIPE,
+			text = True, errors = 'replace')
+		self.started_at = time.time()
+		self.last_report = self.started_at
+		self.reader = threading.Thread(target = self._read_output, args = (self.proc,), daemon = True)
+		self.reader.start()
+
+	def _read_output(self, proc):
+		for line in proc.stdout:
+			line = line.rstrip('\r\n')
+			i = line.find(_STATS_MARKER)
+			if line == _CONFIG_PROMPT and self.host is not None:
+				self.send_config(proc)
+			elif i >= 0 and self.on_stats is not None:
+				try:
+					self.on_stats(self, json.loads(line[i + len(_STATS_MARKER):]))
+				except ValueError as e:
+					self.logger.warning('could not read worker stats due to %s : %s', e, line)
+			elif ' ERROR ' in line or ' CRITICAL ' in line or 'Traceback' in line:
+				self.logger.warning('%s', line)
+			else:
+				self.logger.debug('%s', line)
+
+	def alive(self):
+		return self.proc is not None and self.proc.poll() is None
+
+	def stop(self, timeout = 10.0):
+		'''
+		ask nicely (the gateway logs its stats and closes on ctrl-c), then insist.
+		a remote worker gets its ctrl-c through its terminal; signalling the local ssh would only hang it up.
+		'''
+		if self.proc is None:
+			return
+		if self.proc.poll() is None:
+			if self.host is None:
+				self.proc.send_signal(signal.SIGINT)
+			else:
+				try:
+					self.proc.stdin.write('\x03')
+					self.proc.stdin.flush()
+				except OSError as e:
+					self.logger.warning('could not send ctrl-c due to %s', e)
+			try:
+				self.proc.wait(timeout)
+			except subprocess.TimeoutExpired:
+				self.logger.warning('worker did not stop, killing it')
+				self.proc.kill()
+				self.proc.wait()
+		# let the last of its output (e.g. final stats) through before anyone looks at the totals.
+		self.reader.join(5.0)
+		if self.proc.stdin is not None:
+			try:
+				self.proc.stdin.close()
+			except OSError:
+				pass
+		self.proc = None
+		if self.config_filename is not None:
+			os.remove(self.config_filename)
+			self.config_filename = None
+
+
+class Supervisor(object):
+	'''
+	Args:
+		config_filename: supervisor / gateway json config, see module docstring
+		check_every_sec: how often workers and the config file are checked [1.0]
+		stats_every_sec: how often aggregated stats are logged [60.0]
+		worker_stats_every_sec: how often workers report, unless the config says otherwise; this bounds the counts lost when one dies [10.0]
+		max_restart_wait_sec: cap on the back off for workers that keep failing [60.0]
+		min_healthy_run_sec: a worker that ran at least this long is restarted without back off [60.0]
+	'''
+
+	def __init__(self, config_filename, check_every_sec = 1.0, stats_every_sec = 60.0, worker_stats_every_sec = 10.0, max_restart_wait_sec = 60.0, min_healthy_run_sec = 60.0):
+		self.config_filename = config_filename
+		self.check_every_sec = check_every_sec
+		self.stats_every_sec = stats_every_sec
+		self.worker_stats_every_sec = worker_stats_every_sec
+		self.max_restart_wait_sec = max_restart_wait_sec
+		self.min_healthy_run_sec = min_healthy_run_sec
+		self.logger = logging.getLogger('X2GPSUPERVISOR')
+		self.lock = threading.Lock()
+		self.workers = {}
+		# worker : latest packet_stats from it
+		self.worker_stats = {}
+		# counts from workers that were stopped or died, so totals survive restarts; id : packet_stats
+		self.retired_stats = {}
+		# total time between the last report of a worker and its end, for workers that ended without a final report
+		self.unreported_sec = 0.0
+		self.config_mtime = None
+		self.last_stats_print = time.time()
+
+	def load_config(self):
+		self.config_mtime = os.path.getmtime(self.config_filename)
+		config = config_file_reader(self.config_filename)
+		gateway = config.pop('gateway', 'aprs')
+		if gateway not in _GATEWAYS:
+			raise ValueError('gateway must be one of {:}, got {:}'.format(list(_GATEWAYS.keys()), gateway))
+		shards = [x if isinstance(x, dict) else {'name' : x} for x in config.pop('shards', ['local'])]
+		ssh = config.pop('ssh', ['ssh', '-tt', '-o', 'BatchMode=yes'])
+		ids = config.pop('ids')
+		# workers report often, unless told otherwise, so little is lost when one dies.
+		config.setdefault('print_stats_every_x_seconds', self.worker_stats_every_sec)
+		return gateway, shards, ssh, ids, config
+
+	@staticmethod
+	def shard_sinks(sinks, shard_index, shard_name):
+		'''
+		the sinks config for one shard; workers on the same host would otherwise fight over the tcp port (and crash loop),
+		and append to the same jsonl file.
+		Args:
+			sinks: the sinks config, as for the gateway; None for the default
+			shard_index: position of the shard in shards
+			shard_name: name of the shard
+		'''
+		if sinks is None:
+			return None
+		out = {}
+		for name, config in sinks.items():
+			config = dict(config)
+			if config.get('sink_type', 'glideport') == 'jsonl':
+				root, ext = os.path.splitext(config['path'])
+				config['path'] = '{:}_{:}{:}'.format(root, shard_name, ext)
+			elif config.get('sink_type', 'glideport') == 'tcp':
+				config['port'] = config['port'] + shard_index
+			out[name] = config
+		return out
+
+	def plan(self):
+		'''
+		Returns:
+			dictionary of shard name : ShardWorker (not started) for the current config
+		'''
+		gateway, shards, ssh, ids, config = self.load_config()
+		split = ConsistentHashRing([x['name'] for x in shards]).split(ids)
+		planned = {}
+		for shard_index, shard in enumerate(shards):
+			shard_ids = split.get(shard['name'], {})
+			if len(shard_ids) == 0:
+				continue
+			shard_config = dict(config)
+			shard_config['ids'] = shard_ids
+			if 'sinks' in config:
+				shard_config['sinks'] = self.shard_sinks(config['sinks'], shard_index, shard['name'])
+			planned[shard['name']] = ShardWorker(shard['name'], shard_config, gateway = gateway, host = shard.get('host', None), ssh = ssh, on_stats = self.record_stats)
+		return planned
+
+	def apply(self, planned):
+		'''
+		start workers for new or changed shards, then stop the ones that were replaced or are no longer needed.
+		'''
+		to_stop = []
+		for name, worker in planned.items():
+			old = self.workers.get(name, None)
+			if old is not None and old.config == worker.config and old.gateway == worker.gateway and old.host == worker.host:
+				continue
+			worker.start()
+			self.workers[name] = worker
+			if old is not None:
+				self.logger.info('shard %s changed, replacing its worker', name)
+				to_stop.append(old)
+		for name in [x for x in self.workers if x not in planned]:
+			self.logger.info('shard %s has no ids any more, stopping it', name)
+			to_stop.append(self.workers.pop(name))
+		for worker in to_stop:
+			self.stop_worker(worker)
+		self.logger.info('%0d shards : %s', len(self.workers), {k : len(v.config['ids']) for k, v in self.workers.items()})
+
+	def stop_worker(self, worker):
+		worker.stop()
+		# a worker that stopped cleanly reported on its way out; one that died (or was killed) didn't.
+		unreported = time.time() - worker.last_report
+		if unreported > self.check_every_sec:
+			self.logger.warning('worker for shard %s ended %0.1f sec after its last report, those counts are lost', worker.name, unreported)
+			self.unreported_sec += unreported
+		self.retire_stats(worker)
+
+	def record_stats(self, worker, packet_stats):
+		with self.lock:
+			self.worker_stats[worker] = packet_stats
+			worker.last_report = time.time()
+
+	def retire_stats(self, worker):
+		'''
+		fold the last report of a worker that's gone into the running totals.
+		'''
+		with self.lock:
+			for k, stats in self.worker_stats.pop(worker, {}).items():
+				retired = self.retired_stats.setdefault(k, {})
+				for counter, v in stats.items():
+					retired[counter] = retired.get(counter, 0) + v
+
+	def aggregate_stats(self):
+		'''
+		Returns:
+			(per id packet_stats over all shards, totals per counter)
+		'''
+		with self.lock:
+			per_id = {k : dict(v) for k, v in self.retired_stats.items()}
+			for packet_stats in self.worker_stats.values():
+				for k, stats in packet_stats.items():
+					merged = per_id.setdefault(k, {})
+					for counter, v in stats.items():
+						merged[counter] = merged.get(counter, 0) + v
+		totals = {}
+		for stats in per_id.values():
+			for k, v in stats.items():
+				totals[k] = totals.get(k, 0) + v
+		return per_id, totals
+
+	def log_stats(self):
+		per_id, totals = self.aggregate_stats()
+		self.logger.info('packet stats : %s', per_id)
+		self.logger.info('totals over %0d shards, %0d ids : %s', len(self.workers), len(per_id), totals)
+		if self.unreported_sec > 0:
+			self.logger.info('totals are missing up to %0.1f sec of counts, from workers that ended without a final report', self.unreported_sec)
+		self.logger.info('restarts : %s', {k : v.restarts for k, v in self.workers.items()})
+
+	def check_workers(self):
+		now = time.time()
+		for name, worker in self.workers.items():
+			if worker.alive():
+				continue
+			if worker.proc is not None:
+				ran = now - worker.started_at
+				worker.failures_in_a_row = 0 if ran >= self.min_healthy_run_sec else worker.failures_in_a_row + 1
+				wait = min(self.max_restart_wait_sec, 2 ** worker.failures_in_a_row - 1)
+				self.logger.error('worker for shard %s exited with %s after %0.1f sec, restarting in %0.1f sec', name, worker.proc.returncode, ran, wait)
+				self.stop_worker(worker)
+				worker.next_start = now + wait
+			if now >= worker.next_start:
+				worker.restarts += 1
+				worker.start()
+
+	def check_config(self):
+		try:
+			if os.path.getmtime(self.config_filename) == self.config_mtime:
+				return
+			self.logger.info('config changed, rebalancing')
+			self.apply(self.plan())
+		except Exception as e:
+			# keep running what we have; a half written config file is likely fine a moment later.
+			self.logger.error('could not apply config due to %s', e)
+
+	def run(self):
+		self.apply(self.plan())
+		try:
+			while True:
+				time.sleep(self.check_every_sec)
+				self.check_workers()
+				self.check_config()
+				if time.time() - self.last_stats_print > self.stats_every_sec:
+					self.last_stats_print = time.time()
+					self.log_stats()
+		except KeyboardInterrupt:
+			self.logger.info('stopping upon request')
+		finally:
+			for worker in self.workers.values():
+				self.stop_worker(worker)
+			self.log_stats()
+
+
+def main():
+	parser = argparse.ArgumentParser(description= '''
+run the gateway as several shards, each with its own worker process, locally or on other hosts.
+''', formatter_class= argparse.RawTextHelpFormatter)
+	parser.add_argument('config', type = str, default = '',
+			help= '''
+json config file - the gateway config (see aprs2gpaero / ogn2gpaero), plus
+gateway - 'aprs' or 'ogn'
+shards - list of shard names, or of {"name": ..., "host": ...} for remote workers
+ssh - command used to reach remote hosts''')
+	parser.add_argument('--stats_every_sec', type = float, default = 60.0)
+	parser.add_argument('--worker_stats_every_sec', type = float, default = 10.0, help = 'how often workers report; counts since the last report are lost when a worker dies')
+	parser.add_argument('--verbose', action = 'store_true', help = 'also show all worker output')
+	args = parser.parse_args()
+
+	logging.basicConfig(level = logging.DEBUG if args.verbose else logging.INFO, format = '%(asctime)s %(levelname)-8s %(name)s %(message)s', datefmt = '%Y_%m_%d_%H_%M_%S')
+	# stop the workers with us when e.g. a service manager stops us, not just on ctrl-c.
+	def stop_on_sigterm(signum, frame):
+		raise KeyboardInterrupt
+	signal.signal(signal.SIGTERM, stop_on_sigterm)
+	Supervisor(args.config, stats_every_sec = args.stats_every_sec, worker_stats_every_sec = args.worker_stats_every_sec).run()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,170 @@
+"""
+ways of getting fixes onto glideport.aero (or anything that looks like it).
+
+every uploader takes a list of events, in the ir_push json form:
+	{"imei": "VK6FLYR", "timeStamp": 1554359951000, "point": {"latitude": -32.067333, "longitude": 115.827333, "altitude": 23.1648}}
+and returns the ones it failed to deliver, so one bad fix doesn't take the rest with it.
+
+* IRPushUploader - the original ir_push.php json post, now over a kept alive session, optionally several events per post.
+  with max_events_per_post > 1 this is the supported path for higher rate (~1Hz) sources - one post per cycle, not per fix.
+* StreamUploader - a persistent tcp connection, one short text line per fix and one reply per batch.
+  this is not a glideport protocol - glideport's higher rate (GlideTrak) endpoints aren't documented here - so nothing in production
+  accepts it; it's only in RELAY_UPLOADERS, for the soak harness (and a relay, should one ever exist). the format is ours:
+	imei,timestamp msec,latitude,longitude,altitude\\r\\n   - one per fix
+	\\r\\n                                                 - end of batch
+  and the relay answers each batch with OK <number of fixes>\\r\\n once it has them, or anything else (e.g. ERR\\r\\n) if not.
+  a batch without that answer counts as failed, and is sent again once on a new connection, so the relay should tolerate
+  (or drop) repeated imei / time stamp pairs.
+  change format_event if the receiving end wants a different line format.
+"""
+
+import socket
+import logging
+import requests
+
+
+class Uploader(object):
+	'''
+	base class for uploaders.
+	'''
+
+	def upload(self, events):
+		'''
+		Args:
+			events: list of ir_push style event dictionaries
+		Returns:
+			list of (index into events, exception) for the events that weren't delivered.
+		'''
+		raise NotImplementedError
+
+	def close(self):
+		pass
+
+
+class IRPushUploader(Uploader):
+	'''
+	post events to ir_push.php.
+	Args:
+		url: ['http://glideport.aero/spot/ir_push.php']
+		timeout: seconds [10.0]
+		max_events_per_post: 1 keeps the original one fix per post behaviour [1]
+	'''
+
+	def __init__(self, url = 'http://glideport.aero/spot/ir_push.php', timeout = 10.0, max_events_per_post = 1):
+		self.url = url
+		self.timeout = timeout
+		self.max_events_per_post = max_events_per_post
+		self.logger = logging.getLogger('X2GP')
+		# keeps the connection alive between posts, rather than a new tcp (and dns) setup per fix.
+		self.session = requests.Session()
+
+	def post(self, json_dict):
+		self.logger.info('Uploading %s', json_dict)
+		# from BB's code
+		#curl -H "Accept: application/json" -H "Content-Type: application/json" -d @json_file http://glideport.aero/spot/ir_push.php
+		# Note that the user has to have added  ir_push:IMEI (With the/ a(?) correct IMEI)
+		r = self.session.post(self.url, json = json_dict, timeout = self.timeout)
+		r.raise_for_status()
+		self.logger.info('Received %s', r.text)
+
+	def upload(self, events):
+		failed = []
+		for i in range(0, len(events), self.max_events_per_post):
+			try:
+				self.post({'Version' : 2.0, 'Events' : events[i : i + self.max_events_per_post]})
+			except Exception as e:
+				failed.extend((j, e) for j in range(i, min(i + self.max_events_per_post, len(events))))
+		return failed
+
+	def close(self):
+		self.session.close()
+
+
+class StreamUploader(Uploader):
+	'''
+	stream events over a persistent tcp connection, see module docstring for the format.
+	reconnects and resends (once per upload call) if the connection went away or the batch wasn't acknowledged.
+	Args:
+		host: server address
+		port: server port
+		timeout: seconds, for connecting and sending [10.0]
+	'''
+
+	def __init__(self, host, port, timeout = 10.0):
+		self.host = host
+		self.port = port
+		self.timeout = timeout
+		self.logger = logging.getLogger('X2GP')
+		self.sock = None
+		self._reply_buffer = b''
+
+	@staticmethod
+	def format_event(event):
+		point = event['point']
+		return '{:},{:0d},{:0.6f},{:0.6f},{:0.1f}\r\n'.format(event['imei'], event['timeStamp'], point['latitude'], point['longitude'], point['altitude'])
+
+	def connect(self):
+		self.close()
+		self.logger.info('stream uploader connecting to %s:%s', self.host, self.port)
+		self.sock = socket.create_connection((self.host, self.port), timeout = self.timeout)
+		self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		self._reply_buffer = b''
+
+	def read_reply(self):
+		while b'\r\n' not in self._reply_buffer:
+			chunk = self.sock.recv(1024)
+			if len(chunk) == 0:
+				raise ConnectionError('connection closed before the batch was acknowledged')
+			self._reply_buffer += chunk
+		reply, self._reply_buffer = self._reply_buffer.split(b'\r\n', 1)
+		return reply.decode('utf-8', errors = 'ignore')
+
+	def send_batch(self, data, n):
+		self.sock.sendall(data)
+		reply = self.read_reply()
+		if reply != 'OK {:0d}'.format(n):
+			raise ConnectionError('batch of {:0d} not acknowledged, got *{:}*'.format(n, reply))
+
+	def upload(self, events):
+		if len(events) == 0:
+			return []
+		data = (''.join(self.format_event(e) for e in events) + '\r\n').encode('utf-8')
+		self.logger.debug('Streaming %s', data)
+		try:
+			if self.sock is None:
+				self.connect()
+			self.send_batch(data, len(events))
+		except OSError as e:
+			self.logger.warning('stream upload failed due to %s, reconnecting', e)
+			try:
+				self.connect()
+				self.send_batch(data, len(events))
+			except OSError as e:
+				self.close()
+				return [(i, e) for i in range(len(events))]
+		return []
+
+	def close(self):
+		if self.sock is not None:
+			try:
+				self.sock.close()
+			except OSError:
+				pass
+			self.sock = None
+
+
+# what the gateway configs can use; RELAY_UPLOADERS adds the ones that need something of ours on the receiving end.
+UPLOADERS = {'ir_push' : IRPushUploader}
+RELAY_UPLOADERS = dict(UPLOADERS, stream = StreamUploader)
+
+
+def make_uploader(protocol = 'ir_push', protocols = UPLOADERS, **kwargs):
+	'''
+	Args:
+		protocol: one of protocols
+		protocols: dictionary of protocol : uploader class [UPLOADERS]
+		kwargs: passed on to the uploader
+	'''
+	if protocol not in protocols:
+		raise ValueError('unknown upload protocol {:}, expected one of {:}'.format(protocol, list(protocols.keys())))
+	return protocols[protocol](**kwargs)